@@ -1,10 +1,17 @@
-"""Token 持久化：读写 ~/.stock_fetcher_config.json"""
+"""Token / 自选列表 / 预取计划持久化：读写 ~/.stock_fetcher_config.json；以及不依赖 pandas 的路径常量"""
 
 import json
+import threading
 from pathlib import Path
 
 CONFIG_PATH = Path.home() / ".stock_fetcher_config.json"
 
+OUTPUT_DIR = Path("./output")
+WATCHLIST_DIR = OUTPUT_DIR / "watchlists"  # 自选列表输出：<name>/<code>.xlsx，增量原地更新
+PREFETCH_DIR = OUTPUT_DIR / "prefetch"  # 预取计划输出：<name>/<code>.xlsx + manifest.json
+
+_lock = threading.Lock()  # 串行化读-改-写，任务线程与请求线程可能同时写配置
+
 
 def _read_config() -> dict:
     if CONFIG_PATH.exists():
@@ -24,9 +31,64 @@ def get_token() -> str | None:
 
 
 def save_token(token: str) -> None:
-    cfg = _read_config()
-    cfg["token"] = token
-    _write_config(cfg)
+    with _lock:
+        cfg = _read_config()
+        cfg["token"] = token
+        _write_config(cfg)
+
+
+# ==================== 自选列表 ====================
+# 结构：{"watchlists": {name: {"codes": [...], "years": 3, "last_run": {code: "YYYYMMDD"}}}}
+# last_run 按股票记录上次成功刷新的结束日，新加入的股票没有记录，刷新时全量拉取。
+
+def get_watchlists() -> dict[str, dict]:
+    return _read_config().get("watchlists", {})
+
+
+def save_watchlist(name: str, codes: list[str], years: int) -> None:
+    """新建或覆盖自选列表，保留仍在列表中的股票的刷新点"""
+    with _lock:
+        cfg = _read_config()
+        lists = cfg.setdefault("watchlists", {})
+        last_run = lists.get(name, {}).get("last_run", {})
+        lists[name] = {
+            "codes": codes,
+            "years": years,
+            "last_run": {c: d for c, d in last_run.items() if c in codes},
+        }
+        _write_config(cfg)
+
+
+def delete_watchlist(name: str) -> bool:
+    with _lock:
+        cfg = _read_config()
+        if cfg.get("watchlists", {}).pop(name, None) is None:
+            return False
+        _write_config(cfg)
+        return True
+
+
+def mark_watchlist_run(name: str, codes: list[str], end_date: str) -> None:
+    """记录成功刷新的股票及其结束日，作为下次增量刷新的起点"""
+    with _lock:
+        cfg = _read_config()
+        wl = cfg.get("watchlists", {}).get(name)
+        if wl is None:
+            return
+        last_run = wl.setdefault("last_run", {})
+        for c in codes:
+            if c in wl["codes"]:
+                last_run[c] = end_date
+        _write_config(cfg)
+
+
+# ==================== 预取计划 ====================
+# 结构：{"schedules": [{"name": "nightly", "cron": "30 2 * * 1-5", "codes": [...],
+#                      "years": 3, "start_date": null, "interfaces": null}]}
+# 与 token 一起手工写入配置文件；start_date 优先于 years，interfaces 为 null 表示全部接口。
+
+def get_schedules() -> list[dict]:
+    return _read_config().get("schedules", [])
 
 
 def mask_token(token: str | None) -> str:
@@ -1,13 +1,32 @@
 """FastAPI 入口：挂载路由 + 静态文件"""
 
+import time
+
+_T0 = time.perf_counter()  # 启动耗时基准，须在其余导入之前
+
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
 from .routers import query, ws
+from .services import prefetch, warmup
+
+warmup.record("import_app", (time.perf_counter() - _T0) * 1000)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup.record("app_startup", (time.perf_counter() - _T0) * 1000)
+    # 取数引擎在后台线程加载，不阻塞端口监听；/api/ready 反映预热进度
+    warmup.start()
+    # 预取计划调度线程：按配置中的 cron 在空闲时段拉取
+    prefetch.start()
+    yield
+
 
-app = FastAPI(title="个股基本面查询工具")
+app = FastAPI(title="个股基本面查询工具", lifespan=lifespan)
 
 # 挂载路由
 app.include_router(query.router)
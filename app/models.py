@@ -1,6 +1,7 @@
 """Pydantic 请求/响应模型"""
 
 from datetime import datetime
+from typing import Literal
 
 from pydantic import BaseModel, Field, field_validator, model_validator
 
@@ -10,6 +11,11 @@ class QueryRequest(BaseModel):
     start_date: str | None = Field(None, description="起始日期 YYYYMMDD")
     end_date: str | None = Field(None, description="结束日期 YYYYMMDD")
     years: int = Field(3, ge=1, le=30, description="默认回溯年数")
+    analytics: bool = Field(False, description="是否追加跨股衍生指标（前复权、超额收益、行业相对PE）")
+    shared: Literal["inline", "job"] = Field(
+        "inline", description="大盘/行业数据：inline 写入每个个股文件；job 每个任务只写一份共享文件")
+    verbosity: Literal["quiet", "normal", "debug"] = Field(
+        "normal", description="日志详细程度：quiet 仅错误 / normal 每股一条 / debug 每接口一条")
 
     @field_validator("start_date", "end_date")
     @classmethod
@@ -50,3 +56,47 @@ class TaskStatus(BaseModel):
     total: int = 0
     message: str = ""
     files: list[str] = []
+
+
+class WatchlistRequest(BaseModel):
+    name: str = Field(..., min_length=1, max_length=50, pattern=r"^[\w-]+$",
+                      description="列表名称，用作输出子目录名")
+    codes: str = Field(..., description="股票代码，逗号分隔", max_length=5000)
+    years: int = Field(3, ge=1, le=30, description="首次全量拉取的回溯年数")
+
+
+class WatchlistInfo(BaseModel):
+    name: str
+    codes: list[str]
+    years: int
+    last_run: str | None = None  # 各股刷新点中最早的一个；None 表示尚未完整刷新过
+    pending: int = 0  # 尚未成功刷新过的股票数
+
+
+class ScheduleInfo(BaseModel):
+    name: str
+    cron: str
+    codes: list[str]
+    interfaces: list[str] | None = None  # None 表示全部接口
+    error: str = ""  # 配置无效时的说明，此类计划不会执行
+    queued: bool = False  # 已到点，等待任务槽位空闲
+    stocks: int = 0  # manifest 中已预取的股票数
+    last_run: str | None = None  # 最近一次预取完成时间
+
+
+class FileInfo(BaseModel):
+    name: str
+    path: str
+    size: int
+
+
+class FileList(BaseModel):
+    total: int
+    items: list[FileInfo]
+
+
+class StartupStatus(BaseModel):
+    ready: bool
+    error: str = ""
+    timings_ms: dict[str, float] = {}  # 阶段名 → 耗时（毫秒）
+    http: dict[str, int] = {}  # 连接池复用统计：requests/connections/reused/...
@@ -2,12 +2,18 @@
 
 from pathlib import Path
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Response
 from fastapi.responses import FileResponse
 
-from ..config import get_token, save_token, mask_token
-from ..models import QueryRequest, QueryResponse, TokenRequest, TokenStatus, TaskStatus
-from ..services.fetcher import OUTPUT_DIR
+from ..config import (
+    OUTPUT_DIR, get_token, save_token, mask_token,
+    get_watchlists, save_watchlist, delete_watchlist,
+)
+from ..models import (
+    QueryRequest, QueryResponse, TokenRequest, TokenStatus, TaskStatus, StartupStatus,
+    WatchlistRequest, WatchlistInfo, FileInfo, FileList, ScheduleInfo,
+)
+from ..services import prefetch, warmup
 from ..services.stock_service import task_manager
 
 router = APIRouter(prefix="/api")
@@ -16,6 +22,7 @@ router = APIRouter(prefix="/api")
 @router.post("/token")
 def set_token(req: TokenRequest) -> dict:
     save_token(req.token)
+    warmup.warm_client(req.token)
     return {"ok": True, "masked": mask_token(req.token)}
 
 
@@ -25,6 +32,15 @@ def check_token() -> TokenStatus:
     return TokenStatus(configured=bool(token), masked=mask_token(token))
 
 
+@router.get("/ready")
+def readiness(response: Response) -> StartupStatus:
+    """就绪探针：取数引擎加载完成前或加载失败时返回 503，附启动各阶段耗时与错误信息"""
+    st = warmup.status()
+    if not st["ready"]:
+        response.status_code = 503
+    return StartupStatus(**st)
+
+
 @router.post("/query")
 def start_query(req: QueryRequest) -> QueryResponse:
     token = get_token()
@@ -38,6 +54,9 @@ def start_query(req: QueryRequest) -> QueryResponse:
             start_date=req.start_date,
             end_date=req.end_date,
             years=req.years,
+            analytics=req.analytics,
+            shared=req.shared,
+            verbosity=req.verbosity,
         )
     except (RuntimeError, ValueError) as e:
         raise HTTPException(409, str(e))
@@ -45,6 +64,62 @@ def start_query(req: QueryRequest) -> QueryResponse:
     return QueryResponse(task_id=state.task_id, message="查询已启动")
 
 
+@router.get("/watchlists")
+def list_watchlists() -> list[WatchlistInfo]:
+    result = []
+    for name, wl in sorted(get_watchlists().items()):
+        runs = [wl.get("last_run", {}).get(c) for c in wl["codes"]]
+        done = [d for d in runs if d]
+        result.append(WatchlistInfo(
+            name=name,
+            codes=wl["codes"],
+            years=wl.get("years", 3),
+            last_run=min(done) if done and len(done) == len(runs) else None,
+            pending=len(runs) - len(done),
+        ))
+    return result
+
+
+@router.post("/watchlists")
+def create_watchlist(req: WatchlistRequest) -> dict:
+    codes = list(dict.fromkeys(c.strip() for c in req.codes.split(",") if c.strip()))
+    if not codes:
+        raise HTTPException(400, "股票代码列表为空")
+    save_watchlist(req.name, codes, req.years)
+    return {"ok": True}
+
+
+@router.delete("/watchlists/{name}")
+def remove_watchlist(name: str):
+    if not delete_watchlist(name):
+        raise HTTPException(404, "自选列表不存在")
+    return {"ok": True}
+
+
+@router.post("/watchlists/{name}/refresh")
+def refresh_watchlist(name: str) -> QueryResponse:
+    token = get_token()
+    if not token:
+        raise HTTPException(400, "请先配置 Tushare Token")
+
+    wl = get_watchlists().get(name)
+    if wl is None:
+        raise HTTPException(404, "自选列表不存在")
+
+    try:
+        state = task_manager.start_refresh(token=token, name=name, watchlist=wl)
+    except (RuntimeError, ValueError) as e:
+        raise HTTPException(409, str(e))
+
+    return QueryResponse(task_id=state.task_id, message="刷新已启动")
+
+
+@router.get("/schedules")
+def list_schedules() -> list[ScheduleInfo]:
+    """预取计划（在配置文件中定义）及其最近运行情况"""
+    return [ScheduleInfo(**s) for s in prefetch.status()]
+
+
 @router.get("/status")
 def get_status() -> TaskStatus:
     st = task_manager.current
@@ -61,17 +136,22 @@ def get_status() -> TaskStatus:
 
 
 @router.get("/files")
-def list_files() -> list[dict]:
+def list_files(offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)) -> FileList:
+    """分页列出导出文件（按路径倒序，最新日期在前）；只对当前页的文件取 stat"""
     if not OUTPUT_DIR.exists():
-        return []
-    return [
-        {
-            "name": f.name,
-            "path": f.relative_to(Path(".")).as_posix(),
-            "size": f.stat().st_size,
-        }
-        for f in sorted(OUTPUT_DIR.rglob("*.xlsx"), reverse=True)
-    ]
+        return FileList(total=0, items=[])
+    files = sorted(OUTPUT_DIR.rglob("*.xlsx"), reverse=True)
+    return FileList(
+        total=len(files),
+        items=[
+            FileInfo(
+                name=f.name,
+                path=f.relative_to(Path(".")).as_posix(),
+                size=f.stat().st_size,
+            )
+            for f in files[offset:offset + limit]
+        ],
+    )
 
 
 @router.get("/download/{path:path}")
@@ -9,6 +9,9 @@ from ..services.stock_service import task_manager
 
 router = APIRouter()
 
+# 每轮最多打包的消息数；一轮只发一帧，由前端按动画帧批量渲染
+BATCH_SIZE = 500
+
 
 @router.websocket("/ws/progress/{task_id}")
 async def ws_progress(websocket: WebSocket, task_id: str):
@@ -25,20 +28,22 @@ async def ws_progress(websocket: WebSocket, task_id: str):
             # 快照当前状态，避免竞态
             current_state = state.state
 
-            # 批量读取队列消息（最多 50 条/轮）
+            # 批量读取队列消息
             messages = []
             try:
-                while len(messages) < 50:
+                while len(messages) < BATCH_SIZE:
                     messages.append(state.log_queue.get_nowait())
             except queue.Empty:
                 pass
 
-            # 发送消息，遇到终态立即结束
-            for msg in messages:
-                await websocket.send_json(msg)
+            # 打包成一帧发送，遇到终态截断并结束
+            for i, msg in enumerate(messages):
                 if msg["type"] in ("complete", "error"):
+                    await websocket.send_json({"type": "batch", "items": messages[:i + 1]})
                     await websocket.close()
                     return
+            if messages:
+                await websocket.send_json({"type": "batch", "items": messages})
 
             # 任务已结束且队列已排空
             if current_state != "running" and not messages:
@@ -0,0 +1,129 @@
+"""
+跨股票衍生指标：把全部个股堆叠成一张面板，一次向量化计算，不逐股循环。
+
+输入（PanelCollector 在每只股票拉取完成时收集，只保留所需列）：
+  daily        收盘价
+  adj_factor   复权因子
+  daily_basic  市盈率TTM
+  sw_daily     所属申万一级行业市盈率
+  index_daily  沪深300涨跌幅（全体共享）
+
+输出：每只股票一张 28_衍生指标 工作表
+  前复权收盘价 = 收盘价 × 复权因子 / 区间内最新复权因子
+  超额收益     = 前复权日收益率 − 沪深300涨跌幅
+  累计超额收益 = 区间累计收益 / 沪深300区间累计收益 − 1
+  行业相对PE   = 个股市盈率TTM / 申万一级行业市盈率
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+SHEET_NAME = "28_衍生指标"
+
+_KEY = ["股票代码", "交易日期"]
+
+OUTPUT_COLUMNS = {
+    "交易日期": "交易日期",
+    "收盘价": "收盘价",
+    "复权因子": "复权因子",
+    "qfq": "前复权收盘价",
+    "ret": "日收益率(%)",
+    "mkt": "沪深300涨跌幅(%)",
+    "excess": "超额收益(%)",
+    "cum_excess": "累计超额收益(%)",
+    "市盈率TTM": "市盈率TTM",
+    "ind_pe": "行业市盈率",
+    "rel_pe": "行业相对PE",
+}
+
+
+class PanelCollector:
+    """线程安全地收集各股计算所需的最小列集，日期转 int32、代码转 category 以压缩内存"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._price: list[pd.DataFrame] = []
+        self._adj: list[pd.DataFrame] = []
+        self._pe: list[pd.DataFrame] = []
+        self._ind: list[pd.DataFrame] = []
+
+    def add(self, code: str, data: dict[str, pd.DataFrame],
+            market_sheets: dict[str, pd.DataFrame]) -> None:
+        price = _take(data.get("daily"), code, {"收盘价": "收盘价"})
+        adj = _take(data.get("adj_factor"), code, {"复权因子": "复权因子"})
+        pe = _take(data.get("daily_basic"), code, {"市盈率TTM": "市盈率TTM"})
+        ind = _take(market_sheets.get("sw_daily"), code, {"市盈率": "ind_pe"})
+        with self._lock:
+            for parts, df in ((self._price, price), (self._adj, adj),
+                              (self._pe, pe), (self._ind, ind)):
+                if df is not None:
+                    parts.append(df)
+
+    def compute(self, index_daily: pd.DataFrame | None) -> dict[str, pd.DataFrame]:
+        """在堆叠面板上计算全部衍生指标，返回 {股票代码: 工作表}"""
+        if not self._price:
+            return {}
+
+        panel = _stack(self._price)
+        for parts in (self._adj, self._pe, self._ind):
+            if parts:
+                panel = panel.merge(_stack(parts), on=_KEY, how="left")
+        for col in ("复权因子", "市盈率TTM", "ind_pe"):
+            if col not in panel.columns:
+                panel[col] = np.nan
+
+        mkt = _take(index_daily, None, {"涨跌幅(%)": "mkt"})
+        if mkt is not None:
+            panel = panel.merge(mkt.drop(columns="股票代码"), on="交易日期", how="left")
+        else:
+            panel["mkt"] = np.nan
+
+        panel = panel.sort_values(_KEY, kind="stable").reset_index(drop=True)
+        g = panel.groupby("股票代码", sort=False, observed=True)
+
+        # 前复权：以区间内最新复权因子为基准（停牌缺失的因子沿用前值）
+        adj = g["复权因子"].ffill()
+        latest = adj.groupby(panel["股票代码"], observed=True).transform("last")
+        panel["qfq"] = panel["收盘价"] * adj / latest
+
+        ret = panel["qfq"].groupby(panel["股票代码"], observed=True).pct_change()
+        panel["ret"] = ret * 100
+        panel["excess"] = panel["ret"] - panel["mkt"]
+
+        # 基准只在个股有收益率的交易日计入，使两条累计曲线起点一致
+        mkt_ret = panel["mkt"].where(ret.notna()).fillna(0) / 100
+        growth = (1 + ret.fillna(0)).groupby(panel["股票代码"], observed=True).cumprod()
+        bench = (1 + mkt_ret).groupby(panel["股票代码"], observed=True).cumprod()
+        panel["cum_excess"] = (growth / bench - 1) * 100
+
+        panel["rel_pe"] = panel["市盈率TTM"] / panel["ind_pe"].replace(0, np.nan)
+
+        panel["交易日期"] = panel["交易日期"].astype(str)
+        out = panel[["股票代码", *OUTPUT_COLUMNS]].rename(columns=OUTPUT_COLUMNS)
+        return {
+            str(code): df.drop(columns="股票代码").iloc[::-1].reset_index(drop=True)
+            for code, df in out.groupby("股票代码", sort=False, observed=True)
+        }
+
+
+def _take(df: pd.DataFrame | None, code: str | None, cols: dict[str, str]) -> pd.DataFrame | None:
+    """抽取 交易日期 + 指定列，附上股票代码；缺表或缺列时返回 None"""
+    if df is None or df.empty or "交易日期" not in df.columns:
+        return None
+    if not all(c in df.columns for c in cols):
+        return None
+    out = pd.DataFrame({
+        "股票代码": code,
+        "交易日期": pd.to_numeric(df["交易日期"], errors="coerce").astype("Int32"),
+    })
+    for src, dst in cols.items():
+        out[dst] = pd.to_numeric(df[src], errors="coerce").astype("float64")
+    return out.dropna(subset=["交易日期"]).drop_duplicates(subset="交易日期", keep="last")
+
+
+def _stack(parts: list[pd.DataFrame]) -> pd.DataFrame:
+    df = pd.concat(parts, ignore_index=True)
+    df["股票代码"] = df["股票代码"].astype("category")
+    return df
@@ -0,0 +1,107 @@
+"""
+结构化进度事件
+
+取数热路径不再拼接日志字符串，而是通过 emit() 发出带字段的事件：
+  - 级别门控：logger 未启用该级别时直接返回，不构造任何内容
+  - 惰性格式化：msg % args 只在文本 handler（命令行）中才执行；
+    Web 端 QueueLogHandler 直接推送字段，文本由浏览器渲染
+  - 重复错误合并：ErrorCoalescer 按 (接口, 错误类别) 计数，
+    只上报第 1/10/100/… 次，任务结束时汇总为 "stk_factor_pro 权限不足 ×300"
+
+本模块不依赖 pandas，可被 stock_service 在启动时导入。
+"""
+
+import logging
+import threading
+
+# 事件类型
+JOB_START = "job_start"
+JOB_DONE = "job_done"
+STOCK_START = "stock_start"
+STOCK_DONE = "stock_done"
+STOCK_FAILED = "stock_failed"
+STOCK_INCOMPLETE = "stock_incomplete"
+PERSISTENT_ERROR = "persistent_error"
+ROWS = "rows"
+MARKET_ROWS = "market_rows"
+INDUSTRY = "industry"
+API_ERROR = "api_error"
+ERROR_SUMMARY = "error_summary"
+SAVE_FAILED = "save_failed"
+SHARED_SAVED = "shared_saved"
+ANALYTICS = "analytics"
+PREFETCH_HIT = "prefetch_hit"
+
+# 错误类别 → 中文说明
+ERROR_LABELS = {
+    "permission": "权限不足",
+    "rate_limit": "触发限频",
+    "token": "Token 无效",
+    "network": "网络错误",
+    "other": "调用失败",
+}
+
+# 可能重试即可恢复的错误类别：出现时该股数据不完整，增量刷新点不应推进。
+# other 也可能是持续性错误（参数错误、HTTP 4xx、未识别的权限提示），增量模式下连续出现
+# MAX_OTHER_RUNS 次后不再阻止刷新点推进，见 fetcher.StockFetcher._check_incomplete
+TRANSIENT_ERRORS = frozenset({"rate_limit", "network", "other"})
+
+
+def emit(log: logging.Logger, level: int, kind: str, msg: str, /, *args, **fields) -> None:
+    """发出结构化事件；msg % args 为命令行文本模板，仅在文本 handler 中格式化"""
+    if log.isEnabledFor(level):
+        log.log(level, msg, *args, extra={"event": {"kind": kind, **fields}})
+
+
+def classify_error(exc: BaseException) -> str:
+    msg = str(exc)
+    name = type(exc).__name__
+    if "权限" in msg:
+        return "permission"
+    if "每分钟" in msg or "频率" in msg or "最多访问" in msg:
+        return "rate_limit"
+    if "token" in msg.lower():
+        return "token"
+    if "Timeout" in name or "Connection" in name:
+        return "network"
+    return "other"
+
+
+class ErrorCoalescer:
+    """按 (接口, 错误类别) 合并重复错误"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: dict[tuple[str, str], int] = {}
+
+    def report(self, log: logging.Logger, api: str, exc: BaseException,
+               code: str | None = None) -> str:
+        """记录一次接口错误并返回错误类别；首次及第 10/100/1000… 次发出 api_error 事件"""
+        error = classify_error(exc)
+        with self._lock:
+            n = self._counts[(api, error)] = self._counts.get((api, error), 0) + 1
+        if _is_power_of_ten(n):
+            emit(
+                log, logging.WARNING, API_ERROR,
+                "  ✗ %s %s %s ×%d: %s", code or "-", api, ERROR_LABELS[error], n, str(exc)[:100],
+                api=api, code=code, error=error, count=n, msg=str(exc)[:100],
+            )
+        return error
+
+    def summarize(self, log: logging.Logger) -> None:
+        """任务结束时对重复出现的错误各发一条汇总事件"""
+        with self._lock:
+            items = sorted(self._counts.items(), key=lambda kv: -kv[1])
+        for (api, error), n in items:
+            if n > 1:
+                emit(
+                    log, logging.WARNING, ERROR_SUMMARY,
+                    "%s %s ×%d", api, ERROR_LABELS[error], n,
+                    api=api, error=error, count=n,
+                )
+
+
+def _is_power_of_ten(n: int) -> bool:
+    while n % 10 == 0:
+        n //= 10
+    return n == 1
@@ -5,9 +5,10 @@
 - 接口配置 & 字段映射（常量）
 - RateLimiter    限流器
 - MarketFetcher  大盘/行业数据获取
-- StockFetcher   个股数据批量获取
+- StockFetcher   个股数据批量获取（可选衍生指标阶段见 analytics.py）
 """
 
+import json
 import logging
 import threading
 import time
@@ -17,14 +18,23 @@ from pathlib import Path
 from typing import Union
 
 import pandas as pd
-import tushare as ts
+from openpyxl.styles import Alignment, Border, Font, Side
 
-# ==================== 公共常量 ====================
+from ..config import OUTPUT_DIR
+from . import events as ev
+from .analytics import SHEET_NAME as ANALYTICS_SHEET, PanelCollector
+from .events import ErrorCoalescer, emit
+from .pro_client import ProClient
 
-OUTPUT_DIR = Path("./output")
+# ==================== 公共常量 ====================
 
 MAX_WORKERS = 8  # 并发线程上限，避免大量股票时线程爆炸
 
+# 增量模式下，同一接口连续这么多次出现未归类错误（other）即视为持续性错误：照常推进刷新点，
+# 避免一个接口的参数/权限类错误让该股每次都按不断扩大的窗口重拉全部接口
+MAX_OTHER_RUNS = 3
+RETRY_STATE_FILE = "_retries.json"  # 增量输出目录中记录 {股票: {接口: 连续失败次数}}
+
 # ==================== 个股接口配置 ====================
 
 INTERFACES = [
@@ -55,6 +65,11 @@ INTERFACES = [
     ("limit_list_d",     "24_涨跌停",     "trade_date,ts_code,close,pct_chg,limit_times,limit", "date"),
 ]
 
+# start_date/end_date 按报告期（而非公告日期）过滤的接口。报告期结束后数周至数月才披露，
+# 增量刷新若从上次结束日起查，只会查到尚未披露的报告期，故回看一年多的报告期，重叠部分由合并去重
+PERIOD_INTERFACES = {"fina_indicator", "fina_mainbz", "top10_holders"}
+PERIOD_LOOKBACK_DAYS = 400
+
 FIELD_MAP = {
     "ts_code": "股票代码", "trade_date": "交易日期", "ann_date": "公告日期", "end_date": "报告期",
     "com_name": "公司名称", "chairman": "董事长", "manager": "总经理", "reg_capital": "注册资本(万)",
@@ -114,6 +129,17 @@ SW_FIELD_MAP = {
     "float_mv": "流通市值(万元)", "total_mv": "总市值(万元)",
 }
 
+SHARED_POINTER_SHEET = "25_大盘行业索引"  # job 模式下个股工作簿中指向共享文件的索引页
+
+# ==================== 内存压缩配置 ====================
+
+CODE_COLUMNS = {"股票代码", "指数代码", "行业代码"}
+
+DATE_COLUMNS = {
+    "交易日期", "公告日期", "报告期", "成立日期",
+    "股权登记日", "除权除息日", "报告日期", "调研日期",
+}
+
 
 # ==================== 工具类 ====================
 
@@ -133,6 +159,58 @@ class RateLimiter:
             self._last = time.time()
 
 
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    压缩需要长期驻留内存的结果表：
+      代码列            → category
+      YYYYMMDD 日期列   → Int32
+      整数列            → 最小整数类型
+      低基数字符串列    → category
+    浮点列保持 float64，避免金额类字段丢精度。
+    """
+    df = df.copy()
+    for i, c in enumerate(df.columns):
+        s = df.iloc[:, i]
+        if c in CODE_COLUMNS:
+            s = s.astype("category")
+        elif c in DATE_COLUMNS and _is_yyyymmdd(s):
+            s = pd.to_numeric(s, errors="coerce").astype("Int32")
+        elif pd.api.types.is_integer_dtype(s):
+            s = pd.to_numeric(s, downcast="integer")
+        elif _is_text(s) and s.nunique(dropna=True) <= len(s) // 2:
+            s = s.astype("category")
+        df.isetitem(i, s)
+    return df
+
+
+def frames_nbytes(data: dict[str, pd.DataFrame]) -> int:
+    """统计一组 DataFrame 的实际内存占用（含字符串对象）"""
+    return int(sum(df.memory_usage(deep=True).sum() for df in data.values()))
+
+
+def _is_text(s: pd.Series) -> bool:
+    return pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)
+
+
+def _is_yyyymmdd(s: pd.Series) -> bool:
+    if not _is_text(s):
+        return False
+    return bool(s.dropna().astype(str).str.fullmatch(r"\d{8}").all())
+
+
+_pro_clients: dict[str, ProClient] = {}
+_pro_lock = threading.Lock()
+
+
+def get_pro_api(token: str) -> ProClient:
+    """按 token 复用 Tushare Pro 客户端（进程内单例，启动预热时创建），连接池与并发线程数匹配"""
+    with _pro_lock:
+        pro = _pro_clients.get(token)
+        if pro is None:
+            pro = _pro_clients[token] = ProClient(token, pool_size=MAX_WORKERS)
+        return pro
+
+
 # ==================== 大盘数据获取 ====================
 
 class MarketFetcher:
@@ -142,7 +220,10 @@ class MarketFetcher:
     共三张表，沪深300数据所有个股共享（只拉一次），申万行业按个股精准匹配：
       index_daily      → 25_大盘日线
       index_dailybasic → 26_大盘估值
-      sw_daily         → 27_申万行业
+      sw_daily         → 27_申万行业（按行业缓存，同行业个股共用一份）
+
+    这些表在同一任务的所有工作簿中完全相同，因此序列化后的行也按表缓存
+    （sheet_rows），内联写入时只付一次转换开销。
     """
 
     SHEET_NAMES = {
@@ -152,12 +233,21 @@ class MarketFetcher:
     }
 
     _shared_cache: dict[str, pd.DataFrame] = {}
+    _sw_cache: dict[tuple, pd.DataFrame] = {}  # (l1_code, start, end) → 申万行业日线
+    _sw_locks: dict[tuple, threading.Lock] = {}  # 按行业加锁：同行业的并发个股只有一个去拉取
+    _rows_cache: dict[int, tuple] = {}  # id(df) → (df, 序列化行)；持有 df 以保证 id 不被复用
     _cache_lock = threading.Lock()
 
-    def __init__(self, pro, limiter: RateLimiter, log: logging.Logger):
+    def __init__(self, pro, limiter: RateLimiter, log: logging.Logger,
+                 errors: ErrorCoalescer | None = None):
         self.pro = pro
         self.limiter = limiter
         self.log = log
+        self.errors = errors or ErrorCoalescer()
+        # 临时性错误（限频/网络等）导致的数据缺失 {接口: 错误类别}：共享数据缺失影响全部个股，行业数据按个股记录
+        self.shared_errors: dict[str, str] = {}
+        self._stock_errors: dict[str, dict[str, str]] = {}
+        self._lock = threading.Lock()
 
     # ---------- 对外接口 ----------
 
@@ -167,14 +257,16 @@ class MarketFetcher:
             if self._shared_cache:
                 return
             df = self._fetch_index_daily(start_date, end_date)
-            if not df.empty:
+            if df is not None and not df.empty:
                 self._shared_cache["index_daily"] = self._sort(self._rename(df, MARKET_FIELD_MAP))
-                self.log.info(f"  ✓ 大盘日线: {len(df):,} 条")
+                emit(self.log, logging.INFO, ev.MARKET_ROWS, "  ✓ 大盘日线: %d 条", len(df),
+                     sheet="大盘日线", rows=len(df))
 
             df = self._fetch_index_dailybasic(start_date, end_date)
-            if not df.empty:
+            if df is not None and not df.empty:
                 self._shared_cache["index_dailybasic"] = self._sort(self._rename(df, MARKET_FIELD_MAP))
-                self.log.info(f"  ✓ 大盘估值: {len(df):,} 条")
+                emit(self.log, logging.INFO, ev.MARKET_ROWS, "  ✓ 大盘估值: %d 条", len(df),
+                     sheet="大盘估值", rows=len(df))
 
     def get_sheets(self, stock_code: str, start_date: str, end_date: str) -> dict[str, pd.DataFrame]:
         """返回该个股完整的大盘背景数据"""
@@ -182,20 +274,76 @@ class MarketFetcher:
 
         l1_code, l1_name = self._get_sw_l1(stock_code)
         if l1_code:
-            df = self._fetch_sw_daily(l1_code, start_date, end_date)
+            key = (l1_code, start_date, end_date)
+            with self._sw_lock(key):
+                df = self._sw_cache.get(key)
+                if df is None:
+                    df = self._fetch_sw_daily(l1_code, start_date, end_date, stock_code)
+                    if df is None:
+                        df = pd.DataFrame()
+                    elif not df.empty:
+                        df = self._sort(self._rename(df, SW_FIELD_MAP))
+                        self._sw_cache[key] = df
             if not df.empty:
-                result["sw_daily"] = self._sort(self._rename(df, SW_FIELD_MAP))
-                self.log.info(f"  ✓ {stock_code} 申万行业: {l1_name}({l1_code}) | {len(df):,} 条")
+                result["sw_daily"] = df
+                emit(self.log, logging.DEBUG, ev.INDUSTRY, "  ✓ %s 申万行业: %s(%s) | %d 条",
+                     stock_code, l1_name, l1_code, len(df),
+                     code=stock_code, l1_code=l1_code, l1_name=l1_name, rows=len(df))
         else:
-            self.log.warning(f"  - {stock_code} 未找到申万一级行业，跳过")
+            emit(self.log, logging.INFO, ev.INDUSTRY, "  - %s 未找到申万一级行业，跳过", stock_code,
+                 code=stock_code, l1_code=None)
 
         return result
 
+    def errors_for(self, stock_code: str) -> dict[str, str]:
+        """该个股的大盘/行业数据因临时性错误缺失的接口 {接口: 错误类别}"""
+        with self._lock:
+            return {**self.shared_errors, **self._stock_errors.get(stock_code, {})}
+
+    @classmethod
+    def _sw_lock(cls, key: tuple) -> threading.Lock:
+        with cls._cache_lock:
+            return cls._sw_locks.setdefault(key, threading.Lock())
+
     @classmethod
     def clear_cache(cls):
         """清空共享缓存（新任务开始前调用）"""
         with cls._cache_lock:
             cls._shared_cache.clear()
+            cls._sw_cache.clear()
+            cls._sw_locks.clear()
+            cls._rows_cache.clear()
+
+    @classmethod
+    def job_sheets(cls) -> dict[str, pd.DataFrame]:
+        """任务级共享工作簿的全部工作表：沪深300两张 + 本任务涉及的每个申万行业一张"""
+        sheets = {
+            cls.SHEET_NAMES[k]: df for k, df in cls._shared_cache.items()
+        }
+        for df in cls._sw_cache.values():
+            sheets[cls.sw_sheet_name(df)] = df
+        return sheets
+
+    @classmethod
+    def sheet_rows(cls, df: pd.DataFrame) -> list[tuple]:
+        """DataFrame → 表头 + 原生 Python 值的行列表，按对象缓存，供多个工作簿复用"""
+        with cls._cache_lock:
+            hit = cls._rows_cache.get(id(df))
+            if hit is not None:
+                return hit[1]
+        rows = [tuple(df.columns)]
+        rows += [
+            tuple(None if pd.isna(v) else v for v in r)
+            for r in df.astype(object).itertuples(index=False, name=None)
+        ]
+        with cls._cache_lock:
+            return cls._rows_cache.setdefault(id(df), (df, rows))[1]
+
+    @staticmethod
+    def sw_sheet_name(df: pd.DataFrame) -> str:
+        """共享工作簿中申万行业的工作表名，如 27_申万_银行"""
+        name = df["行业名称"].iloc[0] if "行业名称" in df.columns else df["行业代码"].iloc[0]
+        return f"27_申万_{name}"[:31]
 
     # ---------- 申万行业查询 ----------
 
@@ -210,7 +358,9 @@ class MarketFetcher:
                 row = df.iloc[0]
                 return row["l1_code"], row["l1_name"]
         except Exception as e:
-            self.log.warning(f"  ✗ index_member_all({stock_code}): {str(e)[:80]}")
+            error = self.errors.report(self.log, "index_member_all", e, stock_code)
+            if error in ev.TRANSIENT_ERRORS:
+                self._record(stock_code, "index_member_all", error)
         return None, None
 
     # ---------- 各接口拉取 ----------
@@ -229,24 +379,38 @@ class MarketFetcher:
             fields="ts_code,trade_date,total_mv,float_mv,total_share,float_share,turnover_rate,turnover_rate_f,pe,pe_ttm,pb",
         )
 
-    def _fetch_sw_daily(self, l1_code: str, start: str, end: str) -> pd.DataFrame:
+    def _fetch_sw_daily(self, l1_code: str, start: str, end: str, stock_code: str) -> pd.DataFrame:
         return self._call(
-            "sw_daily",
+            "sw_daily", stock_code,
             ts_code=l1_code, start_date=start, end_date=end,
             fields="ts_code,trade_date,name,open,close,high,low,change,pct_change,vol,amount,pe,pb,float_mv,total_mv",
         )
 
     # ---------- 工具 ----------
 
-    def _call(self, api_name: str, **kwargs) -> pd.DataFrame:
+    def _call(self, api_name: str, stock_code: str | None = None, **kwargs) -> pd.DataFrame | None:
+        """
+        临时性错误记入 stock_code（None 表示全体共享数据）名下并返回 None，
+        其余错误（如权限不足）返回空表
+        """
         self.limiter.wait()
         try:
             result = getattr(self.pro, api_name)(**kwargs)
             return result if result is not None else pd.DataFrame()
         except Exception as e:
-            self.log.warning(f"  ✗ {api_name}: {str(e)[:100]}")
+            error = self.errors.report(self.log, api_name, e, kwargs.get("ts_code"))
+            if error in ev.TRANSIENT_ERRORS:
+                self._record(stock_code, api_name, error)
+                return None
             return pd.DataFrame()
 
+    def _record(self, stock_code: str | None, api_name: str, error: str) -> None:
+        with self._lock:
+            if stock_code is None:
+                self.shared_errors[api_name] = error
+            else:
+                self._stock_errors.setdefault(stock_code, {})[api_name] = error
+
     @staticmethod
     def _rename(df: pd.DataFrame, mapping: dict) -> pd.DataFrame:
         df = df.copy()
@@ -266,12 +430,24 @@ class StockFetcher:
     """个股基本面批量获取器"""
 
     def __init__(self, token: str, log: logging.Logger | None = None):
-        self.pro = ts.pro_api(token)
+        self.pro = get_pro_api(token)
         self.limiter = RateLimiter()
         self._lock = threading.Lock()
         self.done = 0
         self.market_fetcher: MarketFetcher | None = None
         self.save_dir: Path | None = None  # 本次任务的实际输出目录
+        self.incremental = False  # 增量模式：固定文件名，合并已有工作簿
+        self.shared_mode = "inline"  # 大盘/行业表：inline 写入每个工作簿 / job 任务级只写一份
+        self.interfaces = INTERFACES  # 本次任务拉取的个股接口（预取计划可只取其中一部分）
+        self.period_starts: dict[str, str] = {}  # 增量模式下按报告期过滤的接口的起始日
+        self.failed: list[str] = []  # 本次任务拉取、保存失败或因临时性错误数据不完整的股票
+        self.reused = 0  # 直接复用预取结果、未经拉取的股票数（计入进度）
+        self._incomplete: dict[str, dict[str, str]] = {}  # 个股接口的临时性错误 {股票: {接口: 错误类别}}
+        self._retries: dict[str, dict[str, int]] = {}  # 增量模式：未归类错误的连续出现次数
+        self.errors = ErrorCoalescer()  # 本次任务的接口错误计数（重复错误合并上报）
+        self.panel: PanelCollector | None = None  # 衍生指标面板，仅 analytics=True 时收集
+        self.result_bytes = 0  # 本次任务驻留在返回结果中的内存
+        self.peak_stock_bytes = 0  # 单只股票原始数据的内存峰值
 
         if log is not None:
             self.log = log
@@ -290,7 +466,22 @@ class StockFetcher:
         end_date: str | None = None,
         save_path: str = str(OUTPUT_DIR),
         years: int = 3,
+        keep_results: bool = True,
+        analytics: bool = False,
+        shared: str = "inline",
+        interfaces: list[str] | None = None,
     ) -> dict:
+        """
+        批量拉取并逐只落盘。
+
+        keep_results=True 时返回 {code: {接口名: DataFrame}}，结果经 compact_frame 压缩；
+        keep_results=False 时每只股票保存后立即释放数据，返回空 dict（流式，内存与股票数无关）。
+        analytics=True 时在全部个股完成后计算跨股衍生指标：inline 模式追加为各工作簿的 28_衍生指标，
+        job 模式写入任务级 00_衍生指标_<日期>.xlsx（每只股票一张表，避免逐个重写个股工作簿）。
+        shared="inline" 时大盘/行业表写入每个个股工作簿（序列化结果跨工作簿复用）；
+        shared="job" 时只写一份任务级 00_大盘行业_<日期>.xlsx，个股工作簿中保留索引页。
+        interfaces 为个股接口名列表，None 表示全部接口。
+        """
         if isinstance(codes, str):
             codes = [c.strip() for c in codes.split(",") if c.strip()]
 
@@ -300,81 +491,261 @@ class StockFetcher:
         start_date = start_date or (now - timedelta(days=365 * years)).strftime("%Y%m%d")
         today = now.strftime("%Y%m%d")
 
+        self.incremental = False
+        self.shared_mode = shared
+        self.interfaces = _select_interfaces(interfaces)
+        self.period_starts = {}
         self.save_dir = Path(save_path) / today
+        self.panel = PanelCollector() if analytics else None
+        return self._run(codes, dict.fromkeys(codes, start_date), end_date, today, keep_results)
+
+    def refresh(
+        self,
+        codes: list[str],
+        save_path: str | Path,
+        since: dict[str, str | None],
+        end_date: str | None = None,
+        years: int = 3,
+        keep_results: bool = False,
+        shared: str = "inline",
+        start_date: str | None = None,
+        interfaces: list[str] | None = None,
+    ) -> dict:
+        """
+        增量刷新（自选列表、预取计划）：每只股票只拉取 since[code]（上次成功运行的结束日）之后的数据，
+        合并进 save_path 下固定文件名的工作簿（原地更新，不新建日期目录）。
+        since[code] 为 None（首次运行或新加入的股票）时从 start_date 全量拉取，未给出时按 years 回溯。
+        PERIOD_INTERFACES 中的接口按报告期过滤，从 since 回看 PERIOD_LOOKBACK_DAYS 天（不早于全量起始日）。
+        """
+        now = datetime.now()
+        end_date = end_date or now.strftime("%Y%m%d")
+        full_start = start_date or (now - timedelta(days=365 * years)).strftime("%Y%m%d")
+        starts = {c: since.get(c) or full_start for c in codes}
+        self.period_starts = {
+            c: max(full_start, (datetime.strptime(d, "%Y%m%d")
+                                - timedelta(days=PERIOD_LOOKBACK_DAYS)).strftime("%Y%m%d"))
+            for c in codes if (d := since.get(c))
+        }
+
+        # 增量窗口只覆盖新交易日，无法得到完整区间的累计指标，故不做衍生指标
+        self.incremental = True
+        self.shared_mode = shared
+        self.interfaces = _select_interfaces(interfaces)
+        self.save_dir = Path(save_path)
+        self.panel = None
+        return self._run(codes, starts, end_date, now.strftime("%Y%m%d"), keep_results)
+
+    def reuse_prefetched(self, hits: dict[str, Path], start_date: str, end_date: str,
+                         save_path: str = str(OUTPUT_DIR)) -> list[str]:
+        """
+        复用预取工作簿 {code: 路径}：按日期拉取的工作表裁剪到 [start_date, end_date]，
+        按普通查询的文件名与表序写入当日输出目录。返回成功复用的股票，其余应照常拉取。
+        """
+        today = datetime.now().strftime("%Y%m%d")
+        save_dir = Path(save_path) / today
+        save_dir.mkdir(parents=True, exist_ok=True)
+        reused = []
+        for code, src in hits.items():
+            try:
+                frames = _trim_workbook(src, start_date, end_date)
+                with pd.ExcelWriter(save_dir / self._filename(code, today), engine="openpyxl") as w:
+                    for sheet, df in frames.items():
+                        df.to_excel(w, sheet_name=sheet, index=False)
+            except Exception as e:
+                emit(self.log, logging.WARNING, ev.SAVE_FAILED, "%s 预取复用失败，改为拉取: %s", code, e,
+                     code=code, msg=str(e)[:200])
+                continue
+            reused.append(code)
+
+        self.reused += len(reused)
+        if reused:
+            emit(self.log, logging.INFO, ev.PREFETCH_HIT, "预取复用: %d只 | %s",
+                 len(reused), ",".join(reused), stocks=len(reused), codes=reused)
+        return reused
+
+    def _run(self, codes: list[str], starts: dict[str, str], end_date: str,
+             today: str, keep_results: bool) -> dict:
         self.save_dir.mkdir(parents=True, exist_ok=True)
+        self.failed = []
+        self._incomplete = {}
+        self._retries = self._load_retries() if self.incremental else {}
+        self.errors = ErrorCoalescer()
 
         total = len(codes)
+        workers = min(total, MAX_WORKERS)
+        start_date = min(starts.values(), default=end_date)
         days = (datetime.strptime(end_date, "%Y%m%d") - datetime.strptime(start_date, "%Y%m%d")).days
-        self.log.info("=" * 60)
-        self.log.info(f"股票: {total}只 | 并发: {min(total, MAX_WORKERS)}线程 | 周期: {days}天")
-        self.log.info(f"数据: {start_date} ~ {end_date}")
-        self.log.info(f"保存: {self.save_dir}/")
-        self.log.info("=" * 60)
+        emit(
+            self.log, logging.INFO, ev.JOB_START,
+            "股票: %d只 | 并发: %d线程 | 周期: %d天 | 数据: %s ~ %s%s | 保存: %s/",
+            total, workers, days, start_date, end_date,
+            " (增量)" if self.incremental else "", self.save_dir,
+            total=total, workers=workers, days=days, start=start_date, end=end_date,
+            incremental=self.incremental, save_dir=str(self.save_dir),
+        )
 
         if not codes:
             return {}
 
-        # ① 预拉沪深300共享数据（只拉一次）
-        self.market_fetcher = MarketFetcher(self.pro, self.limiter, self.log)
+        # ① 预拉沪深300共享数据（只拉一次，覆盖所有个股中最早的起始日）
+        self.market_fetcher = MarketFetcher(self.pro, self.limiter, self.log, self.errors)
         self.market_fetcher.fetch_shared(start_date, end_date)
 
         # ② 并发拉个股（线程数上限 MAX_WORKERS）
         self.done = 0
+        self.result_bytes = 0
+        self.peak_stock_bytes = 0
+        http0 = self.pro.stats()
         results: dict = {}
         t0 = time.time()
-        ok, fail = 0, 0
 
         with ThreadPoolExecutor(max_workers=min(total, MAX_WORKERS)) as ex:
             futures = {
-                ex.submit(self._fetch_one, c, start_date, end_date, self.save_dir, today, total): c
+                ex.submit(self._fetch_one, c, starts[c], end_date, self.save_dir, today, total): c
                 for c in codes
             }
             for f in as_completed(futures):
-                code = futures[f]
+                # 弹出 future，释放其持有的结果引用
+                code = futures.pop(f)
                 try:
-                    data, cnt, info = f.result()
-                    results[code] = data
-                    ok += 1
-                    self.log.info(f"✓ {code} | {cnt:,}条 | {info}")
+                    data, cnt, done = f.result()
+                    self.peak_stock_bytes = max(self.peak_stock_bytes, frames_nbytes(data))
+                    if keep_results:
+                        data = {k: compact_frame(v) for k, v in data.items()}
+                        results[code] = data
+                        self.result_bytes += frames_nbytes(data)
+                    emit(
+                        self.log, logging.INFO, ev.STOCK_DONE,
+                        "✓ %s | %d条 | [%d/%d] %d张表", code, cnt, done, total, len(data),
+                        code=code, rows=cnt, done=done, total=total, tables=len(data),
+                    )
                 except Exception as e:
-                    fail += 1
-                    self.log.error(f"✗ {code} | {str(e)[:80]}")
+                    self._mark_failed(code)
+                    emit(
+                        self.log, logging.ERROR, ev.STOCK_FAILED, "✗ %s | %s", code, str(e)[:80],
+                        code=code, error=type(e).__name__, msg=str(e)[:200],
+                    )
 
-        self.log.info("=" * 60)
-        self.log.info(f"完成! 成功:{ok} 失败:{fail} 耗时:{time.time() - t0:.1f}秒")
-        self.log.info("=" * 60)
+        if self.shared_mode == "job":
+            try:
+                self._save_shared(today)
+            except Exception as e:
+                emit(self.log, logging.ERROR, ev.SAVE_FAILED, "共享数据保存失败: %s", e,
+                     code=None, msg=str(e)[:200])
+
+        # ③ 可选：跨股衍生指标（面板向量化计算，再逐只追加工作表）
+        if self.panel is not None:
+            self._write_analytics(today)
+
+        if self.incremental:
+            self._save_retries()
+
+        self.errors.summarize(self.log)
+        ok = len(codes) - len(self.failed)
+        elapsed = time.time() - t0
+        http = {k: v - http0[k] for k, v in self.pro.stats().items()}
+        emit(
+            self.log, logging.INFO, ev.JOB_DONE,
+            "完成! 成功:%d 失败:%d 耗时:%.1f秒 | 内存: 驻留结果 %.1fMB 单股峰值 %.1fMB"
+            " | 连接: 请求 %d 新建 %d 复用 %d gzip %d 流量 %.1fMB",
+            ok, len(self.failed), elapsed,
+            self.result_bytes / 1048576, self.peak_stock_bytes / 1048576,
+            http["requests"], http["connections"], http["reused"],
+            http["gzip_responses"], http["wire_bytes"] / 1048576,
+            ok=ok, fail=len(self.failed), elapsed=round(elapsed, 1),
+            result_bytes=self.result_bytes, peak_bytes=self.peak_stock_bytes, http=http,
+        )
         return results
 
     def _fetch_one(self, code: str, start: str, end: str,
                    save_dir: Path, today: str, total: int) -> tuple:
         data: dict = {}
-        info: list[str] = []
+        emit(self.log, logging.DEBUG, ev.STOCK_START, "→ %s", code, code=code)
 
-        for name, sheet, fields, typ in INTERFACES:
-            df = self._api(name, code, start, end, fields, typ)
+        for name, sheet, fields, typ in self.interfaces:
+            s = self.period_starts.get(code, start) if name in PERIOD_INTERFACES else start
+            df = self._api(name, code, s, end, fields, typ)
             if df is not None and not df.empty:
                 df.columns = [FIELD_MAP.get(c, c) for c in df.columns]
                 data[name] = df
-                info.append(f"{sheet[3:]}:{len(df)}")
+                emit(self.log, logging.DEBUG, ev.ROWS, "  %s %s: %d", code, name, len(df),
+                     code=code, api=name, rows=len(df))
 
         market_sheets = self.market_fetcher.get_sheets(code, start, end)
+        with self._lock:
+            errors = {**self._incomplete.get(code, {})}
+        errors.update(self.market_fetcher.errors_for(code))
+        self._check_incomplete(code, errors)
+        if self.panel is not None:
+            self.panel.add(code, data, market_sheets)
 
         if data or market_sheets:
             try:
                 self._save(code, data, market_sheets, save_dir, today)
             except Exception as e:
-                self.log.error(f"  {code} 保存失败: {e}")
+                # 保存失败不中断其余股票，但计入失败，增量模式下不推进该股的刷新点
+                self._mark_failed(code)
+                emit(self.log, logging.ERROR, ev.SAVE_FAILED, "  %s 保存失败: %s", code, e,
+                     code=code, msg=str(e)[:200])
 
         with self._lock:
             self.done += 1
-            prog = f"[{self.done}/{total}]"
+            done = self.done
 
         cnt = sum(len(d) for d in data.values())
-        detail = (
-            f'{prog} {" ".join(info[:5])}{"..." if len(info) > 5 else ""}'
-            if info else f"{prog} 无数据"
+        return data, cnt, done
+
+    def _write_analytics(self, today: str):
+        t0 = time.time()
+        sheets = self.panel.compute(MarketFetcher._shared_cache.get("index_daily"))
+        t1 = time.time()
+        if self.shared_mode == "job":
+            written, file = self._save_analytics_job(sheets, today), self._analytics_filename(today)
+        else:
+            written, file = self._append_analytics(sheets, today), None
+        rows = sum(len(d) for d in sheets.values())
+        emit(
+            self.log, logging.INFO, ev.ANALYTICS,
+            "衍生指标: %d只 | 面板 %d行 | 计算 %.2f秒 | 写入 %.1f秒",
+            written, rows, t1 - t0, time.time() - t1,
+            stocks=written, rows=rows, compute_s=round(t1 - t0, 2), write_s=round(time.time() - t1, 1),
+            file=file,
         )
-        return data, cnt, detail
+        self.panel = None
+
+    def _save_analytics_job(self, sheets: dict[str, pd.DataFrame], today: str) -> int:
+        """job 模式：全部个股的衍生指标写入一个任务级工作簿，每只股票一张表"""
+        if not sheets:
+            return 0
+        path = self.save_dir / self._analytics_filename(today)
+        try:
+            with pd.ExcelWriter(path, engine="openpyxl") as w:
+                for code, df in sorted(sheets.items()):
+                    df.to_excel(w, sheet_name=code, index=False)
+        except Exception as e:
+            emit(self.log, logging.ERROR, ev.SAVE_FAILED, "衍生指标写入失败: %s", e,
+                 code=None, msg=str(e)[:200])
+            return 0
+        return len(sheets)
+
+    def _append_analytics(self, sheets: dict[str, pd.DataFrame], today: str) -> int:
+        """
+        inline 模式：追加到各个股工作簿。openpyxl 的追加模式会完整解析并重写整个工作簿，
+        耗时与个股写入相当（见 analytics 事件的 write_s）；大批量任务宜用 shared="job"。
+        """
+        written = 0
+        for code, df in sheets.items():
+            path = self.save_dir / self._filename(code, today)
+            if not path.exists():
+                continue
+            try:
+                with pd.ExcelWriter(path, engine="openpyxl", mode="a", if_sheet_exists="replace") as w:
+                    df.to_excel(w, sheet_name=ANALYTICS_SHEET, index=False)
+                written += 1
+            except Exception as e:
+                emit(self.log, logging.ERROR, ev.SAVE_FAILED, "  %s 衍生指标写入失败: %s", code, e,
+                     code=code, msg=str(e)[:200])
+        return written
 
     def _api(self, name: str, code: str, start: str, end: str,
              fields: str, typ: str) -> pd.DataFrame:
@@ -388,9 +759,59 @@ class StockFetcher:
             elif typ == "market":
                 return fn(start_date=start, end_date=end, fields=fields)
         except Exception as e:
-            self.log.warning(f"  {code} {name}: {e}")
+            error = self.errors.report(self.log, name, e, code)
+            if error in ev.TRANSIENT_ERRORS:
+                with self._lock:
+                    self._incomplete.setdefault(code, {})[name] = error
         return pd.DataFrame()
 
+    def _check_incomplete(self, code: str, errors: dict[str, str]) -> None:
+        """
+        有临时性错误的股票计入失败（已拿到的数据照常保存），增量模式下不推进其刷新点；
+        但若全部错误都是同一批接口连续 MAX_OTHER_RUNS 次的未归类错误，视为持续性错误并上报。
+        """
+        with self._lock:
+            prev = self._retries.get(code, {})
+            runs = {api: prev.get(api, 0) + 1 for api, err in errors.items() if err == "other"}
+            if runs:
+                self._retries[code] = runs
+            else:
+                self._retries.pop(code, None)
+        if not errors:
+            return
+
+        if self.incremental and len(runs) == len(errors) and min(runs.values()) >= MAX_OTHER_RUNS:
+            apis = ",".join(sorted(runs))
+            emit(self.log, logging.WARNING, ev.PERSISTENT_ERROR,
+                 "  ! %s %s 连续%d次调用失败，视为持续性错误，刷新点照常推进", code, apis, min(runs.values()),
+                 code=code, apis=sorted(runs), runs=min(runs.values()))
+            return
+
+        self._mark_failed(code)
+        emit(self.log, logging.WARNING, ev.STOCK_INCOMPLETE, "  ! %s 部分接口临时失败，数据不完整: %s",
+             code, ",".join(sorted(errors)), code=code, apis=sorted(errors))
+
+    def _load_retries(self) -> dict[str, dict[str, int]]:
+        path = self.save_dir / RETRY_STATE_FILE
+        if path.exists():
+            try:
+                return json.loads(path.read_text(encoding="utf-8"))
+            except (json.JSONDecodeError, OSError):
+                pass
+        return {}
+
+    def _save_retries(self) -> None:
+        path = self.save_dir / RETRY_STATE_FILE
+        if self._retries:
+            path.write_text(json.dumps(self._retries, ensure_ascii=False, indent=2), encoding="utf-8")
+        elif path.exists():
+            path.unlink()
+
+    def _mark_failed(self, code: str) -> None:
+        with self._lock:
+            if code not in self.failed:
+                self.failed.append(code)
+
     def _save(self, code: str, data: dict, market_sheets: dict,
               save_dir: Path, today: str):
         sheets: dict[str, list] = {}
@@ -398,27 +819,233 @@ class StockFetcher:
             if name in data:
                 sheets.setdefault(sheet, []).append(data[name])
 
-        save_dir.mkdir(parents=True, exist_ok=True)
-        filename = f'{code.replace(".", "_")}_{today}.xlsx'
-        with pd.ExcelWriter(save_dir / filename, engine="openpyxl") as w:
-            for sheet, dfs in sheets.items():
-                if len(dfs) == 1:
-                    df = dfs[0]
-                elif "日线" in sheet:
-                    df = dfs[0]
-                    for d in dfs[1:]:
-                        df = df.merge(d, on=["股票代码", "交易日期"], how="outer")
+        frames: dict[str, pd.DataFrame] = {}
+        for sheet, dfs in sheets.items():
+            if len(dfs) == 1:
+                df = dfs[0]
+            elif "日线" in sheet:
+                df = dfs[0]
+                for d in dfs[1:]:
+                    df = df.merge(d, on=["股票代码", "交易日期"], how="outer")
+            else:
+                df = pd.concat(dfs, ignore_index=True)
+            frames[sheet] = df
+
+        # 大盘/行业表：job 模式只写索引页；内联模式复用缓存的序列化行（增量模式需合并，走 DataFrame）
+        shared_rows: dict[str, list] = {}
+        if self.shared_mode == "job":
+            pointer = self._shared_pointer(market_sheets, today)
+            if not pointer.empty:
+                frames[SHARED_POINTER_SHEET] = pointer
+        else:
+            for api_name, sheet_name in MarketFetcher.SHEET_NAMES.items():
+                df = market_sheets.get(api_name)
+                if df is None or df.empty:
+                    continue
+                if self.incremental:
+                    frames[sheet_name] = df
                 else:
-                    df = pd.concat(dfs, ignore_index=True)
-
-                for c in ["交易日期", "公告日期", "报告期"]:
-                    if c in df.columns:
-                        df = df.sort_values(c, ascending=False)
-                        break
+                    shared_rows[sheet_name] = MarketFetcher.sheet_rows(df)
 
+        save_dir.mkdir(parents=True, exist_ok=True)
+        path = save_dir / self._filename(code, today)
+        if self.incremental and path.exists():
+            frames = self._merge_existing(path, frames)
+        # 先完成排序再打开 writer，避免中途出错留下残缺文件
+        frames = {sheet: _sort_sheet(df) for sheet, df in frames.items()}
+
+        with pd.ExcelWriter(path, engine="openpyxl") as w:
+            for sheet, df in frames.items():
                 df.to_excel(w, sheet_name=sheet, index=False)
+            for sheet, rows in shared_rows.items():
+                _append_rows(w.book, sheet, rows)
+
+    def _save_shared(self, today: str):
+        """job 模式：整个任务的大盘/行业数据只写一份"""
+        frames = MarketFetcher.job_sheets()
+        if not frames:
+            return
+        path = self.save_dir / self._shared_filename(today)
+        if self.incremental and path.exists():
+            frames = self._merge_existing(path, frames)
+        frames = {sheet: _sort_sheet(df) for sheet, df in frames.items()}
+        with pd.ExcelWriter(path, engine="openpyxl") as w:
+            for sheet, df in frames.items():
+                df.to_excel(w, sheet_name=sheet, index=False)
+        emit(self.log, logging.INFO, ev.SHARED_SAVED, "共享数据: %s | %d张表", path.name, len(frames),
+             file=path.name, sheets=len(frames))
+
+    def _shared_pointer(self, market_sheets: dict, today: str) -> pd.DataFrame:
+        """
+        个股工作簿中的索引页：指向共享工作簿里对应的表。
+        不记录条数：增量模式下共享工作簿在任务结束时才与旧文件合并，本次拉取的条数并非表中实际行数。
+        """
+        rows = []
+        for api_name, sheet_name in MarketFetcher.SHEET_NAMES.items():
+            df = market_sheets.get(api_name)
+            if df is None or df.empty:
+                continue
+            if api_name == "sw_daily":
+                sheet_name = MarketFetcher.sw_sheet_name(df)
+            rows.append({
+                "数据": sheet_name.split("_", 1)[1],
+                "文件": self._shared_filename(today),
+                "工作表": sheet_name,
+            })
+        return pd.DataFrame(rows)
 
-            for api_name, sheet_name in MarketFetcher.SHEET_NAMES.items():
-                df = market_sheets.get(api_name)
-                if df is not None and not df.empty:
-                    df.to_excel(w, sheet_name=sheet_name, index=False)
+    @staticmethod
+    def _analytics_filename(today: str) -> str:
+        return f"00_衍生指标_{today}.xlsx"
+
+    def _shared_filename(self, today: str) -> str:
+        return "00_大盘行业.xlsx" if self.incremental else f"00_大盘行业_{today}.xlsx"
+
+    def _filename(self, code: str, today: str) -> str:
+        """普通模式按日期命名；增量模式固定文件名，便于原地更新"""
+        if self.incremental:
+            return f'{code.replace(".", "_")}.xlsx'
+        return f'{code.replace(".", "_")}_{today}.xlsx'
+
+    @staticmethod
+    def _merge_existing(path: Path, frames: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
+        """
+        将新拉取的数据并入已有工作簿：
+          - 全量接口（simple）组成的工作表及共享数据索引页直接用新结果替换
+          - 按日期拉取的工作表与旧数据拼接，按主键去重并以新数据为准
+            （刷新起点当天会被重复拉取，数值可能已修订）
+          - 本次无新数据的工作表原样保留
+        """
+        # dtype=object：保留单元格原始类型，避免 "20240105" 这类文本日期被推断成整数
+        old = pd.read_excel(path, sheet_name=None, engine="openpyxl", dtype=object)
+        merged = dict(old)
+        for sheet, df in frames.items():
+            prev = old.get(sheet)
+            if prev is None or prev.empty or sheet in _REPLACE_SHEETS:
+                merged[sheet] = df
+            else:
+                both = pd.concat([prev, df], ignore_index=True)
+                keys = [c for c in _merge_keys(sheet, both) if c in both.columns] or list(both.columns)
+                # 旧数据经 dtype=object 读回，类型可能与新数据不同（如 1 与 1.0），按规范化后的值比较
+                dup = both[keys].map(_norm_key).duplicated(keep="last")
+                merged[sheet] = both[~dup].reset_index(drop=True)
+        return dict(sorted(merged.items()))
+
+
+def _trim_workbook(path: Path, start_date: str, end_date: str) -> dict[str, pd.DataFrame]:
+    """读取工作簿，按 _WINDOW_COLUMNS 裁剪到 [start_date, end_date] 并排序；工作表按 INTERFACES 顺序排列"""
+    old = pd.read_excel(path, sheet_name=None, engine="openpyxl", dtype=object)
+    order = list(dict.fromkeys(sheet for _, sheet, _, _ in INTERFACES))
+    frames = {}
+    for sheet in [s for s in order if s in old] + [s for s in old if s not in order]:
+        df = old[sheet]
+        col = _WINDOW_COLUMNS.get(sheet) or ("交易日期" if sheet not in _SIMPLE_SHEETS else None)
+        if col in df.columns:
+            # 缺失日期的行无从判断，予以保留
+            dates = df[col].map(_date_str).fillna(start_date)
+            df = df[(dates >= start_date) & (dates <= end_date)].reset_index(drop=True)
+        frames[sheet] = _sort_sheet(df)
+    return frames
+
+
+def _select_interfaces(names: list[str] | None) -> list[tuple]:
+    """按接口名筛选 INTERFACES（保持原顺序）；None 表示全部"""
+    if names is None:
+        return INTERFACES
+    known = {name for name, *_ in INTERFACES}
+    unknown = [n for n in names if n not in known]
+    if unknown:
+        raise ValueError(f"未知接口: {', '.join(unknown)}")
+    return [row for row in INTERFACES if row[0] in names]
+
+
+def _append_rows(book, sheet: str, rows: list[tuple]):
+    """用预序列化的行直接写 openpyxl 工作表，表头样式与 DataFrame.to_excel 一致"""
+    ws = book.create_sheet(sheet)
+    for r in rows:
+        ws.append(r)
+    for cell in ws[1]:
+        cell.font = _HEADER_FONT
+        cell.border = _HEADER_BORDER
+        cell.alignment = _HEADER_ALIGN
+
+
+def _merge_keys(sheet: str, df: pd.DataFrame) -> list[str]:
+    """增量合并的主键列；未登记的表（大盘/行业）按 交易日期 + 代码列，否则整行"""
+    keys = _MERGE_KEYS.get(sheet)
+    if keys is not None:
+        return keys
+    if "交易日期" in df.columns:
+        return ["交易日期", *sorted(c for c in CODE_COLUMNS if c in df.columns)]
+    return list(df.columns)
+
+
+def _norm_key(v):
+    if pd.isna(v):
+        return None
+    if pd.api.types.is_number(v):
+        return float(v)
+    return str(v)
+
+
+def _date_str(v) -> str | None:
+    """经 dtype=object 读回的日期单元格可能是文本或数字，统一为 YYYYMMDD 文本"""
+    if pd.isna(v):
+        return None
+    return str(int(v)) if pd.api.types.is_number(v) else str(v)
+
+
+def _sort_sheet(df: pd.DataFrame) -> pd.DataFrame:
+    for c in ["交易日期", "公告日期", "报告期"]:
+        if c in df.columns:
+            return df.sort_values(c, ascending=False)
+    return df
+
+
+_HEADER_FONT = Font(bold=True)
+_THIN = Side(style="thin")
+_HEADER_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_HEADER_ALIGN = Alignment(horizontal="center", vertical="top")
+
+# 仅由 simple 接口（不按日期过滤，每次返回全量）组成的工作表
+_SIMPLE_SHEETS = (
+    {sheet for _, sheet, _, typ in INTERFACES if typ == "simple"}
+    - {sheet for _, sheet, _, typ in INTERFACES if typ != "simple"}
+)
+
+# 增量合并时整表替换而非拼接的工作表
+_REPLACE_SHEETS = _SIMPLE_SHEETS | {SHARED_POINTER_SHEET}
+
+# 各工作表的窗口列：与接口 start_date/end_date 的过滤口径一致，复用预取结果时据此裁剪
+_WINDOW_FIELDS = ("trade_date", "ann_date", "report_date", "surv_date")
+_WINDOW_COLUMNS = {
+    sheet: "报告期" if name in PERIOD_INTERFACES
+    else FIELD_MAP[next(f for f in _WINDOW_FIELDS if f in fields.split(","))]
+    for name, sheet, fields, typ in INTERFACES if typ != "simple"
+}
+
+# 增量合并时各工作表的主键（同一主键以新拉取的行为准）
+_DAILY_KEY = ["股票代码", "交易日期"]
+_REPORT_KEY = ["股票代码", "公告日期", "报告期"]
+_MERGE_KEYS = {
+    "03_日线行情": _DAILY_KEY,
+    "04_每日指标": _DAILY_KEY,
+    "05_利润表": _REPORT_KEY,
+    "06_资产负债表": _REPORT_KEY,
+    "07_现金流量表": _REPORT_KEY,
+    "08_财务指标": _REPORT_KEY,
+    "09_业绩预告": _REPORT_KEY,
+    "11_主营构成": ["股票代码", "报告期", "业务名称"],
+    "12_十大股东": [*_REPORT_KEY, "股东名称"],
+    "13_股东户数": _REPORT_KEY,
+    "15_股东增减持": ["股票代码", "公告日期", "股东名称", "增减持"],
+    "16_大宗交易": [*_DAILY_KEY, "成交价", "成交量(手)", "买方", "卖方"],
+    "17_北向资金": ["交易日期"],
+    "18_资金流向": _DAILY_KEY,
+    "19_融资融券": _DAILY_KEY,
+    "20_筹码分布": _DAILY_KEY,
+    "21_技术因子": _DAILY_KEY,
+    "22_券商预测": ["股票代码", "报告日期", "机构", "季度"],
+    "23_机构调研": ["股票代码", "调研日期", "接待机构"],
+    "24_涨跌停": _DAILY_KEY,
+}
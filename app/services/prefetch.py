@@ -0,0 +1,308 @@
+"""
+预取计划：在服务进程内按 cron 表达式定时拉取，供交互查询直接复用。
+
+  - 计划写在配置文件的 schedules 中（见 config.get_schedules），每项含代码列表、日期窗口与接口
+  - 调度线程每分钟检查一次；到点的计划在单任务槽位空闲时经 TaskManager 执行，
+    槽位被占用则顺延到下一分钟重试
+  - 输出到 PREFETCH_DIR/<name>/<code>.xlsx，按自选列表的方式增量更新；
+    manifest.json 记录每只股票的 {start, end, complete_through, interfaces, fetched_at}
+  - 交互查询（全部接口、inline、未开启衍生指标）中窗口被预取结果覆盖的股票，
+    将预取工作簿裁剪到请求窗口后写入当日输出目录（StockFetcher.reuse_prefetched），不再调用 Tushare
+
+本模块不依赖 pandas，可在启动时导入。
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from ..config import PREFETCH_DIR, get_schedules, get_token
+
+log = logging.getLogger("prefetch")
+
+# 当日行情/每日指标通常在收盘后入库；此时刻之前完成的预取不计入当天数据
+DATA_READY_HOUR = 18
+
+_NAME_RE = re.compile(r"^[\w-]+$")
+_CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+_lock = threading.Lock()  # 串行化 manifest 读-改-写
+_queued: dict[str, datetime] = {}  # 已到点、等待空闲槽位的计划
+_last_fired: dict[str, datetime] = {}
+_warned: set[str] = set()  # 已提示过的无效计划，避免每分钟重复告警
+
+
+# ==================== cron 表达式 ====================
+# 标准 5 段：分 时 日 月 周（0/7=周日），支持 * a-b a,b */n a-b/n；
+# 日与周都有限定时按"或"匹配，与 cron 一致。
+
+def parse_cron(expr: str) -> tuple[set[int], ...]:
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError(f"cron 表达式须为 5 段: {expr!r}")
+    return tuple(_parse_field(f, lo, hi) for f, (lo, hi) in zip(fields, _CRON_RANGES))
+
+
+def cron_matches(expr: str, dt: datetime) -> bool:
+    minute, hour, dom, month, dow = parse_cron(expr)
+    if dt.minute not in minute or dt.hour not in hour or dt.month not in month:
+        return False
+    dow = {d % 7 for d in dow}
+    day_ok = dt.day in dom
+    week_ok = (dt.weekday() + 1) % 7 in dow
+    if len(dom) < 31 and len(dow) < 7:
+        return day_ok or week_ok
+    return day_ok and week_ok
+
+
+def _parse_field(field: str, lo: int, hi: int) -> set[int]:
+    values: set[int] = set()
+    for part in field.split(","):
+        rng, _, step = part.partition("/")
+        try:
+            step_n = int(step) if step else 1
+            if rng == "*":
+                a, b = lo, hi
+            elif "-" in rng:
+                a, b = (int(x) for x in rng.split("-", 1))
+            else:
+                a = int(rng)
+                b = hi if step else a  # "5/10" 等价于 "5-59/10"
+        except ValueError:
+            raise ValueError(f"cron 字段无效: {part!r}") from None
+        if not lo <= a <= b <= hi or step_n < 1:
+            raise ValueError(f"cron 字段越界: {part!r}")
+        values.update(range(a, b + 1, step_n))
+    return values
+
+
+# ==================== 计划校验 ====================
+
+def schedule_codes(schedule: dict) -> list[str]:
+    codes = schedule.get("codes", [])
+    if isinstance(codes, str):
+        codes = codes.split(",")
+    return list(dict.fromkeys(c.strip() for c in codes if c.strip()))
+
+
+def validate(schedule: dict) -> str:
+    """返回错误说明；计划有效时返回空串"""
+    name = schedule.get("name")
+    if not isinstance(name, str) or not _NAME_RE.match(name):
+        return "name 须为字母/数字/下划线/连字符"
+    try:
+        parse_cron(schedule.get("cron", ""))
+    except (ValueError, AttributeError) as e:
+        return str(e)
+    if not schedule_codes(schedule):
+        return "codes 为空"
+    years = schedule.get("years", 3)
+    if not isinstance(years, int) or isinstance(years, bool) or not 1 <= years <= 30:
+        return "years 须为 1-30 的整数"
+    start_date = schedule.get("start_date")
+    if start_date is not None:
+        try:
+            if not (isinstance(start_date, str) and len(start_date) == 8):
+                raise ValueError
+            datetime.strptime(start_date, "%Y%m%d")
+        except ValueError:
+            return "start_date 须为 YYYYMMDD"
+    interfaces = schedule.get("interfaces")
+    if interfaces is not None:
+        if not isinstance(interfaces, list) or not interfaces:
+            return "interfaces 须为非空的接口名列表"
+        # 接口表在取数引擎中定义；校验发生在调度线程或请求中，按需加载不影响启动
+        from .fetcher import INTERFACES
+
+        known = {name for name, *_ in INTERFACES}
+        unknown = [n for n in interfaces if n not in known]
+        if unknown:
+            return f"未知接口: {', '.join(map(str, unknown))}"
+    return ""
+
+
+# ==================== manifest ====================
+
+def manifest_path(name: str) -> Path:
+    return PREFETCH_DIR / name / "manifest.json"
+
+
+def read_manifest(name: str) -> dict[str, dict]:
+    path = manifest_path(name)
+    if path.exists():
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, OSError):
+            pass
+    return {}
+
+
+def plan(name: str, codes: list[str], full_start: str,
+         interfaces: list[str] | None) -> tuple[dict[str, str | None], dict[str, str]]:
+    """
+    为一次预取计算各股的增量起点与数据起始日：
+    已有记录、接口一致且起始日不晚于 full_start 的股票从上次结束日续拉，其余全量拉取。
+    """
+    manifest = read_manifest(name)
+    since: dict[str, str | None] = {}
+    starts: dict[str, str] = {}
+    for c in codes:
+        entry = manifest.get(c)
+        if (entry and _same_interfaces(entry.get("interfaces"), interfaces)
+                and entry["start"] <= full_start and _workbook(name, c).exists()):
+            since[c] = entry["end"]
+            starts[c] = entry["start"]
+        else:
+            since[c] = None
+            starts[c] = full_start
+    return since, starts
+
+
+def mark_run(name: str, starts: dict[str, str], end_date: str,
+             interfaces: list[str] | None, failed: list[str] = ()) -> None:
+    """
+    记录预取完整成功的股票；complete_through 为数据完整覆盖到的最后一天。
+    failed 中的股票（拉取/保存失败，或任一接口遇到限频、网络等临时性错误）不写入，
+    保留其旧记录：下次预取从旧的结束日续拉，lookup 也不会把缺数据的工作簿当作完整覆盖。
+    """
+    failed = set(failed)
+    skipped = [c for c in starts if c in failed]
+    if skipped:
+        log.warning("预取计划 %s: %d只数据不完整，未更新 manifest: %s",
+                    name, len(skipped), ",".join(skipped[:20]))
+    starts = {c: s for c, s in starts.items() if c not in failed}
+    now = datetime.now()
+    end = datetime.strptime(end_date, "%Y%m%d").date()
+    if now.date() == end and now.hour < DATA_READY_HOUR:
+        end -= timedelta(days=1)
+    entry = {
+        "end": end_date,
+        "complete_through": end.strftime("%Y%m%d"),
+        "interfaces": interfaces,
+        "fetched_at": now.isoformat(timespec="seconds"),
+    }
+    with _lock:
+        manifest = read_manifest(name)
+        for c, start in starts.items():
+            manifest[c] = {"start": start, **entry}
+        path = manifest_path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(path)
+
+
+# ==================== 交互查询复用 ====================
+
+def lookup(codes: list[str], start_date: str, end_date: str) -> dict[str, Path]:
+    """
+    查找覆盖 [start_date, end_date] 且包含全部接口的预取工作簿，返回 {code: 路径}。
+    预取窗口可能比请求更宽，复用时由 StockFetcher.reuse_prefetched 裁剪。
+    """
+    if not PREFETCH_DIR.exists():
+        return {}
+    wanted = set(codes)
+    hits: dict[str, Path] = {}
+    for path in sorted(PREFETCH_DIR.glob("*/manifest.json")):
+        name = path.parent.name
+        for c, entry in read_manifest(name).items():
+            if c not in wanted or c in hits or entry.get("interfaces") is not None:
+                continue
+            if entry["start"] <= start_date and entry["complete_through"] >= end_date:
+                wb = _workbook(name, c)
+                if wb.exists():
+                    hits[c] = wb
+    return hits
+
+
+def _workbook(name: str, code: str) -> Path:
+    return PREFETCH_DIR / name / f'{code.replace(".", "_")}.xlsx'
+
+
+def _same_interfaces(a: list[str] | None, b: list[str] | None) -> bool:
+    return (a is None and b is None) or (a is not None and b is not None and set(a) == set(b))
+
+
+# ==================== 调度线程 ====================
+
+def start() -> None:
+    """启动调度线程（FastAPI startup 时调用）"""
+    threading.Thread(target=_loop, name="prefetch-scheduler", daemon=True).start()
+
+
+def status() -> list[dict]:
+    """各计划的配置、排队状态与 manifest 摘要"""
+    result = []
+    for sch in get_schedules():
+        name = sch.get("name", "")
+        error = validate(sch)
+        manifest = read_manifest(name) if not error else {}
+        fetched = [e["fetched_at"] for e in manifest.values()]
+        result.append({
+            "name": name,
+            "cron": sch.get("cron", ""),
+            "codes": schedule_codes(sch),
+            "interfaces": sch.get("interfaces") if not error else None,
+            "error": error,
+            "queued": name in _queued,
+            "stocks": len(manifest),
+            "last_run": max(fetched) if fetched else None,
+        })
+    return result
+
+
+def _loop() -> None:
+    while True:
+        try:
+            _tick(datetime.now().replace(second=0, microsecond=0))
+        except Exception:
+            log.exception("预取计划调度失败")
+        time.sleep(60 - time.time() % 60 + 0.5)  # 对齐到下一分钟
+
+
+def _tick(now: datetime) -> None:
+    schedules = {}
+    for sch in get_schedules():
+        error = validate(sch)
+        if error:
+            key = f"{sch.get('name')}|{error}"
+            if key not in _warned:
+                _warned.add(key)
+                log.warning("忽略无效预取计划 %s: %s", sch.get("name"), error)
+            continue
+        schedules[sch["name"]] = sch
+        if cron_matches(sch["cron"], now) and _last_fired.get(sch["name"]) != now:
+            _last_fired[sch["name"]] = now
+            _queued.setdefault(sch["name"], now)
+
+    # 已从配置中移除的计划不再执行
+    for name in [n for n in _queued if n not in schedules]:
+        _queued.pop(name)
+    if not _queued:
+        return
+
+    token = get_token()
+    if not token:
+        log.warning("未配置 Tushare Token，预取计划顺延")
+        return
+
+    from .stock_service import task_manager
+
+    if task_manager.is_running():
+        return  # 槽位被交互任务占用，下一分钟重试
+
+    name = next(iter(_queued))
+    try:
+        task_manager.start_prefetch(token, schedules[name])
+    except RuntimeError:
+        return
+    except ValueError as e:
+        _queued.pop(name)
+        log.warning("预取计划 %s 未执行: %s", name, e)
+        return
+    _queued.pop(name)
+    log.info("预取计划 %s 已启动", name)
@@ -1,37 +1,64 @@
-"""Web 集成层：WebStockFetcher + TaskManager + QueueLogHandler"""
+"""
+Web 集成层：TaskManager + QueueLogHandler
+
+本模块被路由在启动时导入，不得在模块级导入 pandas/requests；
+取数引擎（WebStockFetcher）在任务线程内按需加载，见 web_fetcher.py。
+"""
 
 import logging
 import queue
 import threading
+import time
 import uuid
 from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from pathlib import Path
 
-from .fetcher import StockFetcher, MarketFetcher, OUTPUT_DIR
+from ..config import PREFETCH_DIR, WATCHLIST_DIR, mark_watchlist_run
+from . import prefetch
 
 
 # ==================== 日志 Handler ====================
 
 class QueueLogHandler(logging.Handler):
-    """将日志记录推入 queue.Queue，供 WebSocket 消费"""
+    """
+    将日志记录推入 queue.Queue，供 WebSocket 消费。
+
+    带 event 字段的记录（见 events.emit）直接推送紧凑的结构化事件，不做文本格式化；
+    其余普通日志仍按 Formatter 渲染为文本。
+    """
 
     def __init__(self, q: queue.Queue):
         super().__init__()
         self.q = q
 
     def emit(self, record: logging.LogRecord):
+        event = getattr(record, "event", None)
+        if event is not None:
+            item = {"type": "event", "level": record.levelname.lower(),
+                    "ts": round(record.created, 3), **event}
+        else:
+            item = {"type": "log", "text": self.format(record)}
         try:
-            self.q.put_nowait({"type": "log", "text": self.format(record)})
+            self.q.put_nowait(item)
         except queue.Full:
             pass
 
 
-# ==================== WebStockFetcher ====================
+# ==================== 队列 Logger ====================
 
 _WEB_LOGGER_NAME = "web_stock_fetcher"
 
 
-def _make_queue_logger(log_queue: queue.Queue) -> logging.Logger:
+# 每个任务的日志详细程度
+VERBOSITY_LEVELS = {
+    "quiet": logging.WARNING,  # 只有错误与汇总
+    "normal": logging.INFO,    # 每只股票一条
+    "debug": logging.DEBUG,    # 每个接口一条
+}
+
+
+def _make_queue_logger(log_queue: queue.Queue, level: int = logging.INFO) -> logging.Logger:
     """创建/复用一个将日志推入队列的 logger"""
     log = logging.getLogger(_WEB_LOGGER_NAME)
     log.handlers.clear()
@@ -39,26 +66,10 @@ def _make_queue_logger(log_queue: queue.Queue) -> logging.Logger:
     handler = QueueLogHandler(log_queue)
     handler.setFormatter(logging.Formatter("%(asctime)s | %(message)s", datefmt="%H:%M:%S"))
     log.addHandler(handler)
-    log.setLevel(logging.INFO)
+    log.setLevel(level)
     return log
 
 
-class WebStockFetcher(StockFetcher):
-    """继承 StockFetcher，添加进度回调和日志队列"""
-
-    def __init__(self, token: str, log_queue: queue.Queue, progress_cb=None):
-        MarketFetcher.clear_cache()
-        log = _make_queue_logger(log_queue)
-        super().__init__(token, log=log)
-        self._progress_cb = progress_cb
-
-    def _fetch_one(self, code, start, end, save_dir, today, total):
-        result = super()._fetch_one(code, start, end, save_dir, today, total)
-        if self._progress_cb:
-            self._progress_cb(self.done, total)
-        return result
-
-
 # ==================== TaskState ====================
 
 @dataclass
@@ -90,49 +101,111 @@ class TaskManager:
             return self._current is not None and self._current.state == "running"
 
     def start_task(self, token: str, codes: str, start_date: str | None,
-                   end_date: str | None, years: int) -> TaskState:
+                   end_date: str | None, years: int, analytics: bool = False,
+                   shared: str = "inline", verbosity: str = "normal") -> TaskState:
+        code_list = [c.strip() for c in codes.split(",") if c.strip()]
+
+        def job(fetcher):
+            # 预取工作簿自带大盘/行业表且没有衍生指标，仅在 inline 且未开启衍生指标时复用；
+            # 先写出命中的股票，复用失败的照常拉取
+            reused = set()
+            if not analytics and shared == "inline":
+                now = datetime.now()
+                start = start_date or (now - timedelta(days=365 * years)).strftime("%Y%m%d")
+                end = end_date or now.strftime("%Y%m%d")
+                hits = prefetch.lookup(code_list, start, end)
+                if hits:
+                    reused = set(fetcher.reuse_prefetched(hits, start, end))
+
+            # Web 端结果已逐只写入 xlsx，无需在内存中汇总
+            kwargs = {"years": years, "keep_results": False,
+                      "analytics": analytics, "shared": shared}
+            if start_date:
+                kwargs["start_date"] = start_date
+            if end_date:
+                kwargs["end_date"] = end_date
+            fetcher.fetch([c for c in code_list if c not in reused], **kwargs)
+
+        return self._launch(token, code_list, job, "查询完成", verbosity)
+
+    def start_refresh(self, token: str, name: str, watchlist: dict,
+                      verbosity: str = "normal") -> TaskState:
+        """增量刷新自选列表：只拉取各股上次成功刷新之后的数据，原地更新工作簿"""
+        code_list = list(watchlist["codes"])
+        since = dict(watchlist.get("last_run", {}))
+
+        def job(fetcher):
+            end = datetime.now().strftime("%Y%m%d")
+            fetcher.refresh(code_list, WATCHLIST_DIR / name, since,
+                            end_date=end, years=watchlist.get("years", 3))
+            mark_watchlist_run(name, [c for c in code_list if c not in fetcher.failed], end)
+
+        return self._launch(token, code_list, job, "刷新完成", verbosity)
+
+    def start_prefetch(self, token: str, schedule: dict,
+                       verbosity: str = "quiet") -> TaskState:
+        """执行预取计划：增量更新 PREFETCH_DIR/<name> 下的工作簿并记录 manifest"""
+        name = schedule["name"]
+        code_list = prefetch.schedule_codes(schedule)
+        interfaces = schedule.get("interfaces")
+
+        def job(fetcher):
+            now = datetime.now()
+            end = now.strftime("%Y%m%d")
+            years = schedule.get("years", 3)
+            full_start = (schedule.get("start_date")
+                          or (now - timedelta(days=365 * years)).strftime("%Y%m%d"))
+            since, starts = prefetch.plan(name, code_list, full_start, interfaces)
+            fetcher.refresh(code_list, PREFETCH_DIR / name, since, end_date=end,
+                            start_date=full_start, interfaces=interfaces)
+            prefetch.mark_run(name, starts, end, interfaces, failed=fetcher.failed)
+
+        return self._launch(token, code_list, job, "预取完成", verbosity)
+
+    def _launch(self, token: str, code_list: list[str], job, done_message: str,
+                verbosity: str = "normal") -> TaskState:
+        """占用单任务槽位并在后台线程中执行 job(fetcher)"""
         with self._lock:
             if self._current is not None and self._current.state == "running":
                 raise RuntimeError("已有任务正在运行，请等待完成")
-
-            task_id = uuid.uuid4().hex[:8]
-            state = TaskState(task_id=task_id)
-
-            code_list = [c.strip() for c in codes.split(",") if c.strip()]
             if not code_list:
                 raise ValueError("股票代码列表为空")
 
-            state.total = len(code_list)
+            state = TaskState(task_id=uuid.uuid4().hex[:8], total=len(code_list))
             self._current = state
+        started = time.time()
 
-        def progress_cb(done: int, total: int):
+        def progress_cb(done: int):
+            """done 为已完成的股票数（含复用预取结果的股票）；total 始终为任务的全部股票数"""
             state.progress = done
-            state.total = total
             try:
                 state.log_queue.put_nowait({
                     "type": "status",
                     "progress": done,
-                    "total": total,
+                    "total": state.total,
+                    "ts": round(time.time(), 3),
+                    "started": round(started, 3),
                 })
             except queue.Full:
                 pass
 
         def run():
             try:
-                fetcher = WebStockFetcher(token, state.log_queue, progress_cb)
-                kwargs = {"years": years}
-                if start_date:
-                    kwargs["start_date"] = start_date
-                if end_date:
-                    kwargs["end_date"] = end_date
+                from .web_fetcher import WebStockFetcher
 
-                fetcher.fetch(code_list, **kwargs)
+                fetcher = WebStockFetcher(token, state.log_queue, progress_cb,
+                                          level=VERBOSITY_LEVELS.get(verbosity, logging.INFO))
+                job(fetcher)
 
                 # 精准收集本次任务输出目录的文件
                 state.files = _collect_files(fetcher.save_dir)
                 state.state = "completed"
-                state.message = "查询完成"
-                state.log_queue.put_nowait({"type": "complete"})
+                state.message = done_message
+                # 定时任务无 WebSocket 消费，队列可能已满，不能因此把任务标记为失败
+                try:
+                    state.log_queue.put_nowait({"type": "complete"})
+                except queue.Full:
+                    pass
             except Exception as e:
                 state.state = "error"
                 state.message = str(e)
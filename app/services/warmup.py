@@ -0,0 +1,81 @@
+"""
+启动预热：后台加载取数引擎、预建 Tushare 客户端，并记录各阶段耗时。
+
+路由只依赖本模块的轻量部分；pandas/requests 在预热线程中导入，
+避免拖慢进程冷启动。/api/ready 通过 status() 暴露预热进度。
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from ..config import get_token
+
+log = logging.getLogger("warmup")
+
+_timings: dict[str, float] = {}
+_ready = threading.Event()
+_error: str = ""
+_client = None  # 预热得到的 ProClient，用于暴露连接复用统计
+
+
+@contextmanager
+def _stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+
+def record(name: str, ms: float) -> None:
+    """记录外部测得的阶段耗时（如 FastAPI 应用导入）"""
+    _timings[name] = round(ms, 1)
+
+
+def start() -> None:
+    """启动后台预热线程（FastAPI startup 时调用）"""
+    threading.Thread(target=_run, name="warmup", daemon=True).start()
+
+
+def warm_client(token: str) -> None:
+    """Token 更新后在后台预建客户端；引擎尚未加载时交由预热线程处理"""
+    if _ready.is_set():
+        threading.Thread(target=_build_client, args=(token,), daemon=True).start()
+
+
+def status() -> dict:
+    """ready：预热已结束且未出错；预热失败时进程无法执行任何任务，不应视为就绪"""
+    return {
+        "ready": _ready.is_set() and not _error,
+        "error": _error,
+        "timings_ms": dict(_timings),
+        "http": _client.stats() if _client is not None else {},
+    }
+
+
+def _run() -> None:
+    global _error
+    t0 = time.perf_counter()
+    try:
+        with _stage("import_engine"):
+            from . import web_fetcher  # noqa: F401  触发 pandas/requests/fetcher 导入
+
+        token = get_token()
+        if token:
+            _build_client(token)
+    except Exception as e:
+        _error = str(e)
+        log.exception("预热失败")
+    finally:
+        _timings["warmup_total"] = round((time.perf_counter() - t0) * 1000, 1)
+        _ready.set()
+
+
+def _build_client(token: str) -> None:
+    global _client
+    from .fetcher import get_pro_api
+
+    with _stage("api_client"):
+        _client = get_pro_api(token)
@@ -0,0 +1,31 @@
+"""WebStockFetcher：带进度回调和日志队列的 StockFetcher（由 TaskManager 按需导入）"""
+
+import logging
+import queue
+
+from .fetcher import StockFetcher, MarketFetcher
+from .stock_service import _make_queue_logger
+
+
+class WebStockFetcher(StockFetcher):
+    """继承 StockFetcher，添加进度回调和日志队列"""
+
+    def __init__(self, token: str, log_queue: queue.Queue, progress_cb=None,
+                 level: int = logging.INFO):
+        MarketFetcher.clear_cache()
+        log = _make_queue_logger(log_queue, level)
+        super().__init__(token, log=log)
+        self._progress_cb = progress_cb
+
+    def reuse_prefetched(self, hits, start_date, end_date, *args, **kwargs):
+        reused = super().reuse_prefetched(hits, start_date, end_date, *args, **kwargs)
+        if reused and self._progress_cb:
+            self._progress_cb(self.reused)
+        return reused
+
+    def _fetch_one(self, code, start, end, save_dir, today, total):
+        result = super()._fetch_one(code, start, end, save_dir, today, total)
+        if self._progress_cb:
+            # 复用预取结果的股票计为已完成
+            self._progress_cb(self.reused + self.done)
+        return result
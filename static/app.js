@@ -10,13 +10,23 @@ const tagList       = document.getElementById("tag-list");
 const startDateEl   = document.getElementById("start-date");
 const endDateEl     = document.getElementById("end-date");
 const yearsEl       = document.getElementById("years");
+const analyticsEl   = document.getElementById("analytics");
+const sharedJobEl   = document.getElementById("shared-job");
+const verbosityEl   = document.getElementById("verbosity");
 const startBtn      = document.getElementById("start-btn");
 const progressSec   = document.getElementById("progress-section");
 const taskStateEl   = document.getElementById("task-state");
 const progressBar   = document.getElementById("progress-bar");
 const logArea       = document.getElementById("log-area");
+const logSpacer     = document.getElementById("log-spacer");
+const logContent    = document.getElementById("log-content");
+const logHint       = document.getElementById("log-hint");
+const throughputEl  = document.getElementById("throughput");
+const filePager     = document.getElementById("file-pager");
 const fileList      = document.getElementById("file-list");
 const refreshBtn    = document.getElementById("refresh-files-btn");
+const saveWlBtn     = document.getElementById("save-watchlist-btn");
+const watchlistList = document.getElementById("watchlist-list");
 
 // ==================== 股票代码列表 ====================
 const stockCodes = [];
@@ -161,17 +171,28 @@ startBtn.addEventListener("click", async () => {
     if (!stockCodes.length) { alert("请先添加股票代码"); return; }
 
     const codes = stockCodes.join(",");
-    const body = { codes, years: parseInt(yearsEl.value) || 3 };
+    const body = {
+        codes,
+        years: parseInt(yearsEl.value) || 3,
+        analytics: analyticsEl.checked,
+        shared: sharedJobEl.checked ? "job" : "inline",
+        verbosity: verbosityEl.value,
+    };
     if (startDateEl.value) body.start_date = startDateEl.value.replace(/-/g, "");
     if (endDateEl.value)   body.end_date   = endDateEl.value.replace(/-/g, "");
 
+    await runTask("/api/query", body);
+});
+
+async function runTask(path, body) {
     startBtn.disabled = true;
-    logArea.textContent = "";
+    logView.clear();
+    throughput.reset();
 
     try {
-        const data = await api("/api/query", {
+        const data = await api(path, {
             method: "POST",
-            body: JSON.stringify(body),
+            body: body ? JSON.stringify(body) : undefined,
         });
         progressSec.style.display = "block";
         setTaskState("running");
@@ -183,6 +204,69 @@ startBtn.addEventListener("click", async () => {
         alert(e.message);
         startBtn.disabled = false;
     }
+}
+
+// ==================== Watchlists ====================
+let watchlists = [];
+
+saveWlBtn.addEventListener("click", async () => {
+    if (!stockCodes.length) { alert("请先添加股票代码"); return; }
+    const name = (prompt("自选列表名称（字母、数字、中文、下划线、短横线）") || "").trim();
+    if (!name) return;
+    try {
+        await api("/api/watchlists", {
+            method: "POST",
+            body: JSON.stringify({ name, codes: stockCodes.join(","), years: parseInt(yearsEl.value) || 3 }),
+        });
+        loadWatchlists();
+    } catch (e) {
+        alert("保存失败: " + e.message);
+    }
+});
+
+async function loadWatchlists() {
+    try {
+        watchlists = await api("/api/watchlists");
+        if (!watchlists.length) {
+            watchlistList.innerHTML = '<em class="empty-hint">暂无自选列表</em>';
+            return;
+        }
+        watchlistList.innerHTML = watchlists.map((w, i) => `
+            <div class="file-item">
+                <span class="wl-name">${w.name}</span>
+                <div class="file-meta">
+                    <span class="file-size">${w.codes.length} 只 &middot; ${
+                        w.last_run ? "刷新至 " + w.last_run : (w.pending ? w.pending + " 只待全量" : "未刷新")
+                    }</span>
+                    <button class="file-dl" data-action="load" data-idx="${i}">载入</button>
+                    <button class="file-dl" data-action="refresh" data-idx="${i}">刷新</button>
+                    <button class="file-del" data-action="delete" data-idx="${i}">删除</button>
+                </div>
+            </div>
+        `).join("");
+    } catch { watchlistList.innerHTML = '<em class="empty-hint">加载失败</em>'; }
+}
+
+watchlistList.addEventListener("click", async (e) => {
+    const btn = e.target.closest("button[data-action]");
+    if (!btn) return;
+    const w = watchlists[btn.dataset.idx];
+    const name = encodeURIComponent(w.name);
+
+    if (btn.dataset.action === "load") {
+        stockCodes.splice(0, stockCodes.length, ...w.codes);
+        renderTags();
+    } else if (btn.dataset.action === "refresh") {
+        await runTask(`/api/watchlists/${name}/refresh`);
+    } else if (btn.dataset.action === "delete") {
+        if (!confirm(`确定删除自选列表「${w.name}」？（已导出的文件保留）`)) return;
+        try {
+            await api(`/api/watchlists/${name}`, { method: "DELETE" });
+        } catch (err) {
+            alert("删除失败: " + err.message);
+        }
+        loadWatchlists();
+    }
 });
 
 // ==================== WebSocket ====================
@@ -212,21 +296,7 @@ function connectWS(taskId) {
 
     ws.onmessage = (ev) => {
         const msg = JSON.parse(ev.data);
-
-        if (msg.type === "log") {
-            appendLog(msg.text);
-        } else if (msg.type === "status") {
-            updateProgress(msg.progress, msg.total);
-        } else if (msg.type === "complete") {
-            setTaskState("completed");
-            finishTask();
-            updateProgress(1, 1);
-            loadFiles();
-        } else if (msg.type === "error") {
-            setTaskState("error");
-            finishTask();
-            if (msg.text) appendLog("ERROR: " + msg.text);
-        }
+        enqueueMessages(msg.type === "batch" ? msg.items : [msg]);
     };
 
     ws.onerror = () => {
@@ -241,9 +311,259 @@ function connectWS(taskId) {
     };
 }
 
+// ==================== 消息批处理 ====================
+// WebSocket 帧只入队，每个动画帧统一处理一次：日志一次性追加，进度条只按最后一条状态更新
+const pendingMsgs = [];
+let flushScheduled = false;
+
+function enqueueMessages(msgs) {
+    for (const m of msgs) pendingMsgs.push(m);
+    if (flushScheduled) return;
+    flushScheduled = true;
+    // 后台标签页不触发 requestAnimationFrame，退回定时器
+    if (document.hidden) setTimeout(flushMessages, 500);
+    else requestAnimationFrame(flushMessages);
+}
+
+function flushMessages() {
+    flushScheduled = false;
+    const msgs = pendingMsgs.splice(0);
+    const lines = [];
+    let status = null;
+    let terminal = null;
+
+    for (const msg of msgs) {
+        if (msg.type === "event") {
+            lines.push(renderEvent(msg));
+            throughput.track(msg);
+        } else if (msg.type === "log") {
+            lines.push(msg.text);
+        } else if (msg.type === "status") {
+            status = msg;
+            throughput.progress(msg);
+        } else if (msg.type === "complete" || msg.type === "error") {
+            terminal = msg;
+        }
+    }
+
+    if (status) updateProgress(status.progress, status.total);
+
+    if (terminal && terminal.type === "complete") {
+        setTaskState("completed");
+        finishTask();
+        updateProgress(1, 1);
+        loadFiles();
+        loadWatchlists();
+    } else if (terminal) {
+        setTaskState("error");
+        finishTask();
+        if (terminal.text) lines.push("ERROR: " + terminal.text);
+    }
+
+    if (lines.length) logView.push(lines);
+}
+
+// ==================== 虚拟化日志 ====================
+// 只保留最近 LOG_MAX_LINES 行，只渲染可视区域附近的行；行高固定，与 .log-area 的 line-height 一致
+const LOG_MAX_LINES = 10000;
+const LOG_LINE_HEIGHT = 20;
+const LOG_OVERSCAN = 10;
+
+const logView = {
+    lines: [],
+    dropped: 0,
+    follow: true,
+    renderScheduled: false,
+
+    push(newLines) {
+        for (const l of newLines) this.lines.push(l);
+        const excess = this.lines.length - LOG_MAX_LINES;
+        if (excess > 0) {
+            this.lines.splice(0, excess);
+            this.dropped += excess;
+        }
+        this.render();
+    },
+
+    clear() {
+        this.lines = [];
+        this.dropped = 0;
+        this.follow = true;
+        this.render();
+    },
+
+    render() {
+        logSpacer.style.height = this.lines.length * LOG_LINE_HEIGHT + "px";
+        if (this.follow) logArea.scrollTop = logArea.scrollHeight;
+
+        const first = Math.max(0, Math.floor(logArea.scrollTop / LOG_LINE_HEIGHT) - LOG_OVERSCAN);
+        const count = Math.ceil(logArea.clientHeight / LOG_LINE_HEIGHT) + LOG_OVERSCAN * 2;
+        logContent.style.transform = `translateY(${first * LOG_LINE_HEIGHT}px)`;
+        logContent.textContent = this.lines.slice(first, first + count).join("\n");
+
+        logHint.textContent = this.dropped
+            ? `仅保留最近 ${LOG_MAX_LINES.toLocaleString()} 行，已省略更早的 ${this.dropped.toLocaleString()} 行`
+            : "";
+    },
+};
+
+logArea.addEventListener("scroll", () => {
+    // 用户向上翻看时停止自动滚动，回到底部后恢复
+    logView.follow = logArea.scrollTop + logArea.clientHeight >= logArea.scrollHeight - LOG_LINE_HEIGHT;
+    if (logView.renderScheduled) return;
+    logView.renderScheduled = true;
+    requestAnimationFrame(() => {
+        logView.renderScheduled = false;
+        logView.render();
+    });
+});
+
 function appendLog(text) {
-    logArea.textContent += text + "\n";
-    logArea.scrollTop = logArea.scrollHeight;
+    logView.push([text]);
+}
+
+// ==================== 吞吐 / ETA ====================
+// 基于 status 进度消息（不受日志详细程度影响，每只股票完成时都会推送），速度取最近 60 秒的滑动窗口；
+// 时间取服务端时间戳，旧消息缺失时退回本地时间
+const THROUGHPUT_WINDOW = 60;
+
+const throughput = {
+    t0: null,
+    samples: [],
+    failed: 0,
+    apiErrors: 0,
+
+    reset() {
+        this.t0 = null;
+        this.samples = [];
+        this.failed = 0;
+        this.apiErrors = 0;
+        throughputEl.textContent = "";
+    },
+
+    progress(msg) {
+        const now = msg.ts ?? Date.now() / 1000;
+        if (msg.started != null) this.t0 = msg.started;
+        else if (this.t0 == null) this.t0 = now;
+        this.samples.push([now, msg.progress]);
+        while (this.samples.length > 2 && now - this.samples[0][0] > THROUGHPUT_WINDOW) {
+            this.samples.shift();
+        }
+        this.render(now, msg.progress, msg.total);
+    },
+
+    track(e) {
+        if (e.kind === "stock_failed" || e.kind === "stock_incomplete") {
+            this.failed++;
+        } else if (e.kind === "api_error") {
+            this.apiErrors++;
+        }
+    },
+
+    render(now, done, total) {
+        const [t, d] = this.samples[0];
+        const span = now - (this.samples.length > 1 ? t : (this.t0 ?? now));
+        const rate = span > 0 ? (done - (this.samples.length > 1 ? d : 0)) / span : 0;
+        const elapsed = this.t0 != null ? now - this.t0 : 0;
+        const eta = rate > 0 ? (total - done) / rate : null;
+        throughputEl.textContent = [
+            `速度 ${(rate * 60).toFixed(1)} 只/分`,
+            `已用 ${fmtDuration(elapsed)}`,
+            `预计剩余 ${eta != null ? fmtDuration(eta) : "--"}`,
+            `失败 ${this.failed}`,
+            `接口错误 ${this.apiErrors}`,
+        ].join(" | ");
+    },
+};
+
+function fmtDuration(sec) {
+    sec = Math.max(0, Math.round(sec));
+    const h = Math.floor(sec / 3600);
+    const m = Math.floor((sec % 3600) / 60);
+    const s = sec % 60;
+    const mm = String(m).padStart(2, "0");
+    const ss = String(s).padStart(2, "0");
+    return h ? `${h}:${mm}:${ss}` : `${mm}:${ss}`;
+}
+
+// ==================== 事件渲染（服务端只推送字段，文本在此生成） ====================
+const ERROR_LABELS = {
+    permission: "权限不足", rate_limit: "触发限频", token: "Token 无效",
+    network: "网络错误", other: "调用失败",
+};
+
+function fmtTime(ts) {
+    const d = new Date(ts * 1000);
+    return [d.getHours(), d.getMinutes(), d.getSeconds()]
+        .map(n => String(n).padStart(2, "0")).join(":");
+}
+
+function fmtMB(bytes) {
+    return (bytes / 1048576).toFixed(1) + "MB";
+}
+
+function renderEvent(e) {
+    let text;
+    switch (e.kind) {
+        case "job_start":
+            text = `股票: ${e.total}只 | 并发: ${e.workers}线程 | 周期: ${e.days}天 | `
+                 + `数据: ${e.start} ~ ${e.end}${e.incremental ? " (增量)" : ""} | 保存: ${e.save_dir}/`;
+            break;
+        case "market_rows":
+            text = `  ✓ ${e.sheet}: ${e.rows.toLocaleString()} 条`;
+            break;
+        case "industry":
+            text = e.l1_code
+                ? `  ✓ ${e.code} 申万行业: ${e.l1_name}(${e.l1_code}) | ${e.rows.toLocaleString()} 条`
+                : `  - ${e.code} 未找到申万一级行业，跳过`;
+            break;
+        case "stock_start":
+            text = `→ ${e.code}`;
+            break;
+        case "rows":
+            text = `  ${e.code} ${e.api}: ${e.rows}`;
+            break;
+        case "stock_done":
+            text = `✓ ${e.code} | ${e.rows.toLocaleString()}条 | [${e.done}/${e.total}] ${e.tables}张表`;
+            break;
+        case "stock_failed":
+            text = `✗ ${e.code} | ${e.msg}`;
+            break;
+        case "stock_incomplete":
+            text = `  ! ${e.code} 部分接口临时失败，数据不完整${e.apis ? ": " + e.apis.join(",") : ""}`;
+            break;
+        case "persistent_error":
+            text = `  ! ${e.code} ${e.apis.join(",")} 连续${e.runs}次调用失败，视为持续性错误，刷新点照常推进`;
+            break;
+        case "api_error":
+            text = `  ✗ ${e.code || "-"} ${e.api} ${ERROR_LABELS[e.error] || e.error}`
+                 + `${e.count > 1 ? " ×" + e.count : ""}: ${e.msg}`;
+            break;
+        case "error_summary":
+            text = `${e.api} ${ERROR_LABELS[e.error] || e.error} ×${e.count}`;
+            break;
+        case "save_failed":
+            text = `  ${e.code || ""} 保存失败: ${e.msg}`;
+            break;
+        case "shared_saved":
+            text = `共享数据: ${e.file} | ${e.sheets}张表`;
+            break;
+        case "analytics":
+            text = `衍生指标: ${e.stocks}只 | 面板 ${e.rows.toLocaleString()}行 | `
+                 + `计算 ${e.compute_s}秒 | 写入 ${e.write_s}秒${e.file ? " | " + e.file : ""}`;
+            break;
+        case "prefetch_hit":
+            text = `预取复用: ${e.stocks}只 | ${e.codes.join(",")}`;
+            break;
+        case "job_done":
+            text = `完成! 成功:${e.ok} 失败:${e.fail} 耗时:${e.elapsed}秒 | `
+                 + `内存: 驻留 ${fmtMB(e.result_bytes)} 单股峰值 ${fmtMB(e.peak_bytes)} | `
+                 + `连接: 请求 ${e.http.requests} 新建 ${e.http.connections} 复用 ${e.http.reused}`;
+            break;
+        default:
+            text = `${e.kind} ${JSON.stringify(e)}`;
+    }
+    return `${fmtTime(e.ts)} | ${text}`;
 }
 
 function updateProgress(done, total) {
@@ -260,6 +580,16 @@ function setTaskState(state) {
 }
 
 // ==================== Files ====================
+// 分页加载，每页 FILES_PAGE_SIZE 个；删除/下载通过事件委托处理
+const FILES_PAGE_SIZE = 50;
+let filesOffset = 0;
+
+function escapeHtml(s) {
+    return String(s).replace(/[&<>"']/g, c => ({
+        "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;",
+    })[c]);
+}
+
 async function deleteFile(path) {
     if (!confirm("确定删除该文件？")) return;
     try {
@@ -276,28 +606,63 @@ async function deleteFile(path) {
 
 async function loadFiles() {
     try {
-        const files = await api("/api/files");
-        if (!files.length) {
+        const data = await api(`/api/files?offset=${filesOffset}&limit=${FILES_PAGE_SIZE}`);
+        // 删除后当前页可能越界，回退到最后一页
+        if (!data.items.length && data.total && filesOffset > 0) {
+            filesOffset = Math.floor((data.total - 1) / FILES_PAGE_SIZE) * FILES_PAGE_SIZE;
+            return loadFiles();
+        }
+        renderPager(data.total);
+        if (!data.total) {
             fileList.innerHTML = '<em class="empty-hint">暂无文件</em>';
             return;
         }
-        fileList.innerHTML = files.map(f => `
+        fileList.innerHTML = data.items.map(f => {
+            const path = escapeHtml(f.path);
+            return `
             <div class="file-item">
-                <a href="/api/download/${f.path}" download>${f.name}</a>
+                <a href="/api/download/${path}" download>${escapeHtml(f.name)}</a>
                 <div class="file-meta">
                     <span class="file-size">${(f.size / 1024).toFixed(1)} KB</span>
-                    <a href="/api/download/${f.path}" download class="file-dl">下载</a>
-                    <button class="file-del" onclick="deleteFile('${f.path.replace(/'/g, "\\'")}')">删除</button>
+                    <a href="/api/download/${path}" download class="file-dl">下载</a>
+                    <button class="file-del" data-path="${path}">删除</button>
                 </div>
-            </div>
-        `).join("");
+            </div>`;
+        }).join("");
     } catch { fileList.innerHTML = '<em class="empty-hint">加载失败</em>'; }
 }
 
+function renderPager(total) {
+    const pages = Math.ceil(total / FILES_PAGE_SIZE);
+    if (pages <= 1) {
+        filePager.innerHTML = "";
+        return;
+    }
+    const page = Math.floor(filesOffset / FILES_PAGE_SIZE) + 1;
+    filePager.innerHTML = `
+        <button class="btn btn-sm" data-page="${page - 1}" ${page <= 1 ? "disabled" : ""}>&lsaquo; 上一页</button>
+        <span class="file-size">第 ${page}/${pages} 页 &middot; 共 ${total} 个文件</span>
+        <button class="btn btn-sm" data-page="${page + 1}" ${page >= pages ? "disabled" : ""}>下一页 &rsaquo;</button>
+    `;
+}
+
+fileList.addEventListener("click", (e) => {
+    const btn = e.target.closest(".file-del[data-path]");
+    if (btn) deleteFile(btn.dataset.path);
+});
+
+filePager.addEventListener("click", (e) => {
+    const btn = e.target.closest("button[data-page]");
+    if (!btn || btn.disabled) return;
+    filesOffset = (parseInt(btn.dataset.page) - 1) * FILES_PAGE_SIZE;
+    loadFiles();
+});
+
 refreshBtn.addEventListener("click", loadFiles);
 
 // ==================== Init ====================
 setDefaultDates();
 loadTokenStatus();
+loadWatchlists();
 loadFiles();
 